@@ -1,23 +1,53 @@
 from datetime import datetime
-from flask import Blueprint, send_file, make_response, g, render_template
+from flask import Blueprint, Response, current_app, g, render_template, request, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
 from models import Cloudfiles, Filecontent, UserStorageQuota, Users
 from extensions import db, redis_client
-from utils.oss_access import get_temp_access_token, get_temp_url, delete_file
-from utils.utils import get_folder_path, unset_folder_path_cache, invalidate_recent_files_cache, get_path_from_parent_folder, json_response_creator, get_file_suffix, encrypt_key, decrypt_key
+from utils.oss_access import get_temp_access_token, get_temp_url, enqueue_oss_purge
+from utils.utils import get_folder_paths, invalidate_folder_path_cache, get_path_from_parent_folder, json_response_creator, get_file_suffix, encrypt_key, decrypt_key, encode_cursor, decode_cursor, get_recycle_bin_count, invalidate_recycle_bin_count, get_file_list_cache_key, get_cached_file_list, set_cached_file_list, invalidate_file_list_cache, json_dumps, json_raw_response_creator, make_etag, not_modified_response, set_etag_headers, get_folder_path_generation
 from utils.filed_check import validate_request, InputValidator
+from utils.text_search import build_search_vector, search_contents, highlight_offsets, build_snippet
+from utils.content_codec import decode_content
+from utils.content_stream import get_content_stream_info, iter_content_range, ContentChangedError
+from utils.text_patch import content_hash, apply_patch
+from utils.recent_files import get_recent_files_index, recent_files_upsert, recent_files_remove, recent_files_reset, get_recent_files_version
+from utils.quota import reserve_upload, release_upload, apply_upload_used_delta
+from utils.file_blobs import acquire_blob, register_blob
+from utils.revisions import record_revision, list_revisions, get_revision_content
+from utils.edit_buffer import get_edit_buffer, get_edit_buffer_version, get_save_context, init_edit_buffer, save_edit_buffer, flush_edit_buffer, discard_edit_buffers, discard_stale_edit_buffer, EDIT_BUFFER_CONFLICT, EDIT_BUFFER_QUOTA_EXCEEDED, EDIT_BUFFER_MISSING
+from utils.file_tree import get_child_ancestors, adjust_folder_stats, is_ancestor, move_subtree, logical_delete_subtree, hard_delete_subtree, find_restore_conflicts, restore_subtree, descendants_filter
 import uuid
 import json
-import io
 import secrets
 from urllib.parse import quote
 
 file_management = Blueprint('file_management', __name__, url_prefix='/file-management')
 
+# 文件列表可选的排序键，每个排序键都有对应的 (user_id, parent_id, is_folder, 排序键, id) 部分索引
+FILE_LIST_SORT_COLUMNS = {
+    'name': Cloudfiles.name,
+    'size': db.func.coalesce(Cloudfiles.size, 0),
+    'updated_at': Cloudfiles.updated_at
+}
+# 文件列表返回的字段，只查询这些列（不取 user_id、deleted_at、ancestors），行直接转为字典
+FILE_LIST_COLUMNS = (
+    Cloudfiles.id, Cloudfiles.name, Cloudfiles.is_folder, Cloudfiles.parent_id, Cloudfiles.oss_path,
+    Cloudfiles.size, Cloudfiles.created_at, Cloudfiles.updated_at, Cloudfiles.file_suffix,
+    Cloudfiles.online_editable, Cloudfiles.tree_size, Cloudfiles.tree_file_count
+)
+FILE_LIST_DEFAULT_LIMIT = 100
+FILE_LIST_MAX_LIMIT = 500
+
 """
 获取当前用户指定目录下的文件和文件夹列表。
+支持游标（keyset）分页：
+    - sort_by：name / size / updated_at，默认 updated_at
+    - order：asc / desc，默认 asc；文件与文件夹分组排序（asc 文件在前，desc 文件夹在前）
+    - limit：每页条数，默认100，最大500
+    - cursor：上一页返回的 next_cursor
 Returns:
-    JSON响应，包含 file_and_folder_list。
+    JSON响应，包含 file_and_folder_list 和 next_cursor（没有下一页时为 None）。
 """
 @file_management.route('/file-list/')
 @jwt_required()
@@ -26,7 +56,11 @@ Returns:
     field_validators={
         "parent_id": InputValidator.validate_file_id,
         "type_id": InputValidator.validate_select_code,
-        "editable_id": InputValidator.validate_select_code
+        "editable_id": InputValidator.validate_select_code,
+        "sort_by": InputValidator.validate_sort_by,
+        "order": InputValidator.validate_sort_order,
+        "limit": InputValidator.validate_positive_int,
+        "cursor": InputValidator.validate_cursor
     }
 )
 def file_list():
@@ -34,11 +68,41 @@ def file_list():
     parent_id = g.validated_data.get('parent_id') # 找该父目录下的目录和文件，不传值则找根目录
     type_id = g.validated_data.get('type_id') # 1:文件 2:文件夹 不传值:全部
     editable_id = g.validated_data.get('editable_id') # 1:可在线编辑 2:不可在线编辑 不传值:全部
-    file_and_folder = Cloudfiles.query.filter_by(user_id=user_id, parent_id=parent_id, deleted_at=None)
+    sort_by = g.validated_data.get('sort_by') or 'updated_at'
+    order = g.validated_data.get('order') or 'asc'
+    cursor = g.validated_data.get('cursor')
+    limit = g.validated_data.get('limit')
+    if limit is not None:
+        limit = min(max(int(limit), 1), FILE_LIST_MAX_LIMIT)
+    else:
+        limit = FILE_LIST_DEFAULT_LIMIT
+    # 列表缓存，key 中带有文件夹版本号，增删改时按文件夹失效
+    cache_key = get_file_list_cache_key(user_id, parent_id, {
+        'type_id': type_id,
+        'editable_id': editable_id,
+        'sort_by': sort_by,
+        'order': order,
+        'limit': limit,
+        'cursor': cursor
+    })
+    # ETag 由缓存key（用户版本号 + 文件夹版本号 + 查询参数）生成，与客户端一致时直接返回 304，不读缓存也不查库
+    etag = make_etag(cache_key) if cache_key is not None else None
+    not_modified = not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+    if cache_key is not None:
+        cached = get_cached_file_list(cache_key)
+        if cached is not None:
+            return set_etag_headers(json_raw_response_creator("1", "success", cached), etag)
+    file_and_folder = db.session.query(*FILE_LIST_COLUMNS).filter(
+        Cloudfiles.user_id == user_id,
+        Cloudfiles.parent_id == parent_id,
+        Cloudfiles.deleted_at.is_(None)
+    )
     if type_id == '1':
-        file_and_folder = file_and_folder.filter_by(is_folder=False)
+        file_and_folder = file_and_folder.filter(Cloudfiles.is_folder == False)
     elif type_id == '2':
-        file_and_folder = file_and_folder.filter_by(is_folder=True)
+        file_and_folder = file_and_folder.filter(Cloudfiles.is_folder == True)
     if editable_id == '1':
         file_and_folder = file_and_folder.filter(
             db.or_(
@@ -54,21 +118,64 @@ def file_list():
             )
         )
 
-    file_and_folder = file_and_folder.order_by(Cloudfiles.is_folder, Cloudfiles.updated_at).all()
+    # 排序键为 (is_folder, sort_by, id)，id 保证顺序唯一，游标为上一页最后一行的排序键
+    sort_keys = (Cloudfiles.is_folder, FILE_LIST_SORT_COLUMNS[sort_by], Cloudfiles.id)
+    if cursor:
+        cursor_values = decode_cursor(cursor)
+        if not cursor_values or len(cursor_values) != 5 or cursor_values[:2] != [sort_by, order]:
+            return json_response_creator("2", "cursor is invalid")
+        try:
+            is_folder, sort_value, last_id = cursor_values[2:]
+            if sort_by == 'updated_at':
+                sort_value = datetime.fromisoformat(sort_value)
+            elif sort_by == 'size':
+                sort_value = int(sort_value)
+            last_key = db.tuple_(bool(is_folder), sort_value, uuid.UUID(last_id))
+        except (TypeError, ValueError):
+            return json_response_creator("2", "cursor is invalid")
+        if order == 'asc':
+            file_and_folder = file_and_folder.filter(db.tuple_(*sort_keys) > last_key)
+        else:
+            file_and_folder = file_and_folder.filter(db.tuple_(*sort_keys) < last_key)
+    file_and_folder = file_and_folder.order_by(
+        *(key.asc() if order == 'asc' else key.desc() for key in sort_keys)
+    )
+
+    next_cursor = None
+    file_and_folder = file_and_folder.limit(limit + 1).all()
+    if len(file_and_folder) > limit:
+        file_and_folder = file_and_folder[:limit]
+        last = file_and_folder[-1]
+        if sort_by == 'updated_at':
+            sort_value = last.updated_at.isoformat()
+        elif sort_by == 'size':
+            sort_value = last.size or 0
+        else:
+            sort_value = last.name
+        next_cursor = encode_cursor([sort_by, order, last.is_folder, sort_value, str(last.id)])
     file_and_folder_list = [
-        f.to_dict() for f in file_and_folder
+        row._asdict() for row in file_and_folder
     ]
-    return json_response_creator(
+    # 只编码一次，同一份 bytes 既写入缓存又作为响应体
+    result = json_dumps({"file_and_folder_list": file_and_folder_list, "next_cursor": next_cursor})
+    if cache_key is not None:
+        set_cached_file_list(cache_key, result)
+    return set_etag_headers(json_raw_response_creator(
         "1",
         "success",
-        {"file_and_folder_list": file_and_folder_list}
-    )
+        result
+    ), etag)
+
 
+RECYCLE_BIN_MAX_LIMIT = 100
 
 """
 获取逻辑删除（移动至回收站）的文件或文件夹列表。
+按 (deleted_at DESC, id DESC) 游标分页：传入上一页返回的 cursor 取下一页；
+未传 cursor 时按 offset 取（兼容页码跳转）。
+total 取自回收站条数缓存，不在每次请求时 COUNT。
 Returns:
-    JSON响应，包含被删除文件信息。
+    JSON响应，包含被删除文件信息和 next_cursor。
 """
 @file_management.route('/recycle-bin/', methods=['GET'])
 @jwt_required()
@@ -76,27 +183,44 @@ Returns:
     required_fields=[],
     field_validators={
         "offset": InputValidator.validate_positive_int,
-        "limit": InputValidator.validate_positive_int
+        "limit": InputValidator.validate_positive_int,
+        "cursor": InputValidator.validate_cursor
     }
 )
 def recycle_bin():
     try:
         user_id = get_jwt_identity()
         offset = int(g.validated_data.get('offset', 0))
-        limit = int(g.validated_data.get('limit', 10))
-        total_count = Cloudfiles.query.filter(
-            Cloudfiles.user_id == user_id,
-            Cloudfiles.deleted_at.isnot(None)
-        ).count()
+        limit = min(max(int(g.validated_data.get('limit', 10)), 1), RECYCLE_BIN_MAX_LIMIT)
+        cursor = g.validated_data.get('cursor')
         # 查询被逻辑删除的文件或文件夹（deleted_at 不为空）
-        deleted_items = Cloudfiles.query.filter(
+        query = db.session.query(
+            Cloudfiles.id, Cloudfiles.name, Cloudfiles.size, Cloudfiles.is_folder, Cloudfiles.oss_path,
+            Cloudfiles.online_editable, Cloudfiles.deleted_at, Cloudfiles.parent_id
+        ).filter(
             Cloudfiles.user_id == user_id,
             Cloudfiles.deleted_at.isnot(None)
-        ).order_by(Cloudfiles.deleted_at.desc()).offset(offset).limit(limit).all()
+        )
+        if cursor:
+            cursor_values = decode_cursor(cursor)
+            try:
+                last_key = db.tuple_(datetime.fromisoformat(cursor_values[0]), uuid.UUID(cursor_values[1]))
+            except (TypeError, ValueError, IndexError):
+                return json_response_creator('2', 'cursor is invalid')
+            query = query.filter(db.tuple_(Cloudfiles.deleted_at, Cloudfiles.id) < last_key)
+        elif offset:
+            query = query.offset(offset)
+        deleted_items = query.order_by(Cloudfiles.deleted_at.desc(), Cloudfiles.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(deleted_items) > limit:
+            deleted_items = deleted_items[:limit]
+            last = deleted_items[-1]
+            next_cursor = encode_cursor([last.deleted_at.isoformat(), str(last.id)])
+        # 批量获取完整路径（使用 parent_id 获取路径）
+        path_infos = get_folder_paths([item.parent_id for item in deleted_items], user_id)
         result = []
         for item in deleted_items:
-            # 获取完整路径（使用 parent_id 获取路径）
-            path_info = get_folder_path(item.parent_id)
+            path_info = path_infos[item.parent_id]
             result.append({
                 'id': item.id,
                 'name': item.name,
@@ -112,7 +236,8 @@ def recycle_bin():
             'success',
             {
                 'items': result,
-                'total': total_count
+                'total': get_recycle_bin_count(user_id),
+                'next_cursor': next_cursor
             }
         )
     except Exception as e:
@@ -123,7 +248,10 @@ def recycle_bin():
         )
 
 """
-获取当前用户最近修改的20个文件，支持Redis缓存加速。
+获取当前用户最近修改的20个文件。
+读取 Redis 中按 updated_at 排序的最近文件索引（有序集合 + 元数据哈希），索引未建立时从数据库重建；
+路径在读取时按 parent_id 批量获取。
+ETag 由索引版本号与路径缓存代数生成，与 If-None-Match 一致时返回 304。
 Returns:
     JSON响应，包含 recent_files 列表。
 """
@@ -131,61 +259,44 @@ Returns:
 @jwt_required()
 def get_recent_files():
     user_id = get_jwt_identity()
-    redis_key = f"recent_files:{user_id}"
-    redis_data = redis_client.get(redis_key)
-
-    if redis_data:
-        recent_files = json.loads(redis_data)
-        for recent_file in recent_files:
-            if recent_file['updated_at']:
-                recent_file['updated_at'] = datetime.fromisoformat(recent_file['updated_at'])
-        return json_response_creator(
-            '1',
-            'success (from redis)',
-            recent_files
-        )
-
-    # Fallback：从数据库查询
-    files = Cloudfiles.query.filter_by(
-        user_id=user_id,
-        is_folder=False,
-        deleted_at=None
-    ).order_by(Cloudfiles.updated_at.desc()).limit(20).all()
-
-    recent_files = []
-    for f in files:
-        path_list = get_folder_path(f.parent_id).get("filePath", [])
-        full_path = f"{'/ ' if len(path_list) > 0 else ''}{' / '.join(p['name'] for p in path_list)} /"
-        recent_files.append({
-            'id': str(f.id),
-            'parent_id': str(f.parent_id),
-            'name': f.name,
-            'size': f.size,
-            'updated_at': f.updated_at.isoformat() if f.updated_at else None,
-            'online_editable': f.online_editable,
-            'oss_path': f.oss_path,
-            'path': [{'id': p['id'], 'name': p['name']} for p in path_list],
-            'full_path': full_path
-        })
-
-    redis_client.set(redis_key, json.dumps(recent_files), ex=3600)  # 1小时有效
-
-    return json_response_creator(
+    # 先取版本号再读数据
+    version = get_recent_files_version(user_id)
+    path_generation = get_folder_path_generation(user_id)
+    etag = make_etag('recent-files', user_id, version, path_generation) if version is not None and path_generation is not None else None
+    not_modified = not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+    recent_files, from_redis = get_recent_files_index(user_id)
+    path_infos = get_folder_paths([f['parent_id'] for f in recent_files], user_id)
+    for f in recent_files:
+        path_list = path_infos[f['parent_id']].get("filePath", [])
+        f['path'] = [{'id': p['id'], 'name': p['name']} for p in path_list]
+        f['full_path'] = f"{'/ ' if len(path_list) > 0 else ''}{' / '.join(p['name'] for p in path_list)} /"
+    return set_etag_headers(json_response_creator(
         '1',
-        'success (from db)',
+        'success (from redis)' if from_redis else 'success (from db)',
         recent_files
-    )
+    ), etag)
+
+FIND_FILE_DEFAULT_LIMIT = 50
+FIND_FILE_MAX_LIMIT = 100
 
 """
-根据文件ID或文件名模糊查找当前用户的文件或文件夹。
+根据文件名模糊查找当前用户的文件。
+ILIKE 过滤走 (user_id, name) trigram 部分索引，按 similarity 排序，游标为 (score, id)。
+可选过滤：suffix（文件后缀）、folderId（只在该文件夹的子树中查找）。
 Returns:
-    JSON响应，包含 filePath 和当前文件信息。
+    JSON响应，包含 items（每项含 path 和 score）与 next_cursor。
 """
 @file_management.route('/find-file/')
 @validate_request(
     required_fields=["fileName"],
     field_validators={
-        "fileName": InputValidator.validate_file_name
+        "fileName": InputValidator.validate_file_name,
+        "suffix": InputValidator.validate_file_suffix,
+        "folderId": InputValidator.validate_file_id,
+        "limit": InputValidator.validate_positive_int,
+        "cursor": InputValidator.validate_cursor
     }
 )
 @jwt_required()
@@ -193,22 +304,51 @@ def find_file():
     try:
         user_id = get_jwt_identity()
         file_or_folder_name = g.validated_data.get('fileName')
-        file_or_folder = (Cloudfiles.query.filter_by(user_id=user_id, deleted_at=None, is_folder=False)
-                          .filter(Cloudfiles.name.ilike(f'%{file_or_folder_name}%')).all())
-        if not file_or_folder:
+        suffix = g.validated_data.get('suffix')
+        folder_id = g.validated_data.get('folderId')
+        limit = min(max(int(g.validated_data.get('limit', FIND_FILE_DEFAULT_LIMIT)), 1), FIND_FILE_MAX_LIMIT)
+        cursor = g.validated_data.get('cursor')
+        # LIKE 通配符转义，按字面量匹配
+        pattern = file_or_folder_name.replace('%', '\\%').replace('_', '\\_')
+        # similarity() 返回 real，转为 double precision 后再排序、比较：游标中的分数为 Python float（double），
+        # 与 real 比较时 real 会被提升为 double，两者的十进制表示不一致，分页边界上会跳过或重复返回行
+        score = db.cast(db.func.similarity(Cloudfiles.name, file_or_folder_name), DOUBLE_PRECISION)
+        query = (db.session.query(*FILE_LIST_COLUMNS, score.label('score'))
+                 .filter(Cloudfiles.user_id == user_id,
+                         Cloudfiles.deleted_at.is_(None),
+                         Cloudfiles.is_folder == False,
+                         Cloudfiles.name.ilike(f'%{pattern}%')))
+        if suffix:
+            query = query.filter(db.func.lower(db.func.ltrim(Cloudfiles.file_suffix, '.')) == suffix.lstrip('.').lower())
+        if folder_id:
+            query = query.filter(descendants_filter(folder_id))
+        if cursor:
+            cursor_values = decode_cursor(cursor)
+            try:
+                last_key = db.tuple_(float(cursor_values[0]), uuid.UUID(cursor_values[1]))
+            except (TypeError, ValueError, IndexError):
+                return json_response_creator('2', 'cursor is invalid')
+            query = query.filter(db.tuple_(score, Cloudfiles.id) < last_key)
+        rows = query.order_by(score.desc(), Cloudfiles.id.desc()).limit(limit + 1).all()
+        if not rows and not cursor:
             return json_response_creator(
                 '9',
                 'File or folder not found'
             )
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1].score, str(rows[-1].id)])
+        path_infos = get_folder_paths([row.parent_id for row in rows], user_id)
         result = []
-        for item in file_or_folder:
-            item_dict = item.to_dict()
-            item_dict['path'] = get_folder_path(item.parent_id).get("filePath", [])
+        for row in rows:
+            item_dict = row._asdict()
+            item_dict['path'] = path_infos[row.parent_id].get("filePath", [])
             result.append(item_dict)
         return json_response_creator(
             '1',
             'success',
-            result
+            {'items': result, 'next_cursor': next_cursor}
         )
     except Exception as e:
         print(e)
@@ -217,26 +357,115 @@ def find_file():
             'Database error'
         )
 
+SEARCH_CONTENT_DEFAULT_LIMIT = 20
+SEARCH_CONTENT_MAX_LIMIT = 50
+
+"""
+在当前用户的在线编辑文件内容中全文检索。
+使用 filecontent.search_vector 的 GIN 索引，按 ts_rank_cd 排序，游标为 (score, id)。
+Returns:
+    JSON响应，包含 items（每项含 snippet、highlights、path、score）与 next_cursor。
+"""
+@file_management.route('/search-content/')
+@validate_request(
+    required_fields=["keyword"],
+    field_validators={
+        "keyword": InputValidator.validate_search_keyword,
+        "limit": InputValidator.validate_positive_int,
+        "cursor": InputValidator.validate_cursor
+    }
+)
+@jwt_required()
+def search_content():
+    try:
+        user_id = get_jwt_identity()
+        keyword = g.validated_data.get('keyword').strip()
+        limit = min(max(int(g.validated_data.get('limit', SEARCH_CONTENT_DEFAULT_LIMIT)), 1), SEARCH_CONTENT_MAX_LIMIT)
+        cursor = g.validated_data.get('cursor')
+        last_key = None
+        if cursor:
+            cursor_values = decode_cursor(cursor)
+            try:
+                last_key = (float(cursor_values[0]), str(uuid.UUID(cursor_values[1])))
+            except (TypeError, ValueError, IndexError):
+                return json_response_creator('2', 'cursor is invalid')
+        rows, terms = search_contents(user_id, keyword, limit + 1, last_key)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1].score, str(rows[-1].id)])
+        path_infos = get_folder_paths([row.parent_id for row in rows], user_id)
+        result = []
+        for row in rows:
+            snippet, snippet_truncated = build_snippet(
+                decode_content(row.content_codec, row.content, row.content_blob), terms
+            )
+            result.append({
+                'id': row.id,
+                'name': row.name,
+                'file_suffix': row.file_suffix,
+                'parent_id': row.parent_id,
+                'size': row.size,
+                'updated_at': row.updated_at,
+                'score': row.score,
+                'snippet': snippet,
+                'snippet_truncated': snippet_truncated,
+                'highlights': highlight_offsets(snippet, terms),
+                'path': path_infos[row.parent_id].get("filePath", [])
+            })
+        return json_response_creator(
+            '1',
+            'success',
+            {'items': result, 'next_cursor': next_cursor}
+        )
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'Database error'
+        )
+
 """
 获取用于访问OSS的临时访问Token（STS）。
+传入 fileSize 时先预留该大小的上传配额，配额不足则不签发STS；预留ID随凭证返回，
+上传完成后传给 insert-file，上传失败或取消时调用 release-upload 释放，未释放的预留到期自动失效。
 Returns:
-    JSON响应，包含 access_token。
+    JSON响应，包含 access_token 与 reservation_id（未传 fileSize 时为 None）。
 """
 @file_management.route('/get-sts/')
 @jwt_required()
+@validate_request(
+    required_fields=[],
+    field_validators={
+        "fileSize": InputValidator.validate_positive_int
+    }
+)
 def get_sts():
     user_id = get_jwt_identity()
+    file_size = g.validated_data.get('fileSize')
     redis_key = f"sts_count:{user_id}"
     # 获取当前次数
     count = redis_client.get(redis_key)
     count = int(count) if count else 0
     if count >= 5:
         return json_response_creator("9", "3分钟内调用次数已达上限")
+    reservation_id = None
+    if file_size is not None:
+        try:
+            reservation_id = reserve_upload(user_id, int(file_size))
+        except Exception as e:
+            # Redis 不可用时不阻塞上传，insert-file 时仍会在数据库中检查配额
+            print(f"Quota reserve error: {e}")
+        else:
+            if reservation_id is None:
+                return json_response_creator("9", "user storage quota not enough")
     # 增加次数并设置3分钟有效期
     redis_client.incr(redis_key)
     redis_client.expire(redis_key, 180)
     access_token = get_temp_access_token()
     if access_token is None:
+        release_upload(user_id, reservation_id)
         return json_response_creator(
             "9",
             "please check oss control service log"
@@ -244,11 +473,57 @@ def get_sts():
     return json_response_creator(
         "1",
         "success",
-        {"access_token": access_token}
+        {"access_token": access_token, "reservation_id": reservation_id}
+    )
+
+"""
+释放上传配额预留（上传失败或取消时调用）。
+Returns:
+    JSON响应，释放结果。
+"""
+@file_management.route('/release-upload/', methods=['POST'])
+@jwt_required()
+@validate_request(
+    required_fields=["reservationId"],
+    field_validators={
+        "reservationId": InputValidator.validate_reservation_id
+    }
+)
+def release_upload_reservation():
+    user_id = get_jwt_identity()
+    release_upload(user_id, g.validated_data.get('reservationId'))
+    return json_response_creator('1', 'released')
+
+# 新建上传文件的 cloudfiles 行并计入配额与祖先文件夹统计，提交后更新各缓存；配额不足时回滚并返回 None
+def _create_uploaded_file(user_id, file_name, parent_id, ancestors, oss_path, file_size, content_hash):
+    cloud_file = Cloudfiles(
+        user_id=user_id,
+        name=file_name,
+        is_folder=False,
+        parent_id=parent_id,
+        oss_path=oss_path,
+        size=file_size,
+        file_suffix=get_file_suffix(file_name),
+        ancestors=ancestors,
+        content_hash=content_hash
     )
+    if not UserStorageQuota.increase_upload_used(user_id, file_size):
+        db.session.rollback()
+        return None
+    db.session.add(cloud_file)
+    adjust_folder_stats(user_id, ancestors, file_size, 1)
+    db.session.commit()
+    # 配额已计入数据库，同步到Redis镜像
+    apply_upload_used_delta(user_id, file_size)
+    recent_files_upsert(user_id, [cloud_file])
+    # 父文件夹的列表新增一项，祖先文件夹的 tree_size 变化
+    invalidate_file_list_cache(user_id, [None, *ancestors])
+    return cloud_file
 
 """
 新增文件记录。
+传入 contentHash（文件内容的 SHA-256）时登记为可秒传的对象；已有相同内容的对象时（并发上传了同一文件）
+文件改为指向已有对象，本次上传的对象放入删除队列。
 Returns:
     JSON响应，保存结果。
 """
@@ -260,7 +535,9 @@ Returns:
         "fileName": InputValidator.validate_file_name,
         "parentId": InputValidator.validate_file_id,
         "ossPath": InputValidator.validate_file_path,
-        "fileSize": InputValidator.validate_positive_int
+        "fileSize": InputValidator.validate_positive_int,
+        "reservationId": InputValidator.validate_reservation_id,
+        "contentHash": InputValidator.validate_content_hash
     }
 )
 def insert_file():
@@ -271,26 +548,28 @@ def insert_file():
         parent_id = data.get('parentId', None)
         oss_path = data.get('ossPath')
         file_size = int(data.get('fileSize', 0))
-        file_suffix = get_file_suffix(file_name)
-        cloud_file = Cloudfiles(
-            user_id=user_id,
-            name=file_name,
-            is_folder=False,
-            parent_id=parent_id,
-            oss_path=oss_path,
-            size=file_size,
-            file_suffix=file_suffix
-        )
-        user_storage_quota = UserStorageQuota.query.filter_by(user_id=user_id).first()
-        if not user_storage_quota.increase_upload_used(file_size):
-            db.session.rollback()
+        reservation_id = data.get('reservationId')
+        content_hash = data.get('contentHash')
+        ancestors = get_child_ancestors(user_id, parent_id)
+        if ancestors is None:
+            return json_response_creator('9', 'Parent folder not found')
+        duplicate_path = None
+        if content_hash:
+            blob_path = register_blob(user_id, content_hash, oss_path, file_size)
+            if blob_path is None:
+                # 相同哈希的对象大小不一致，不参与去重
+                content_hash = None
+            elif blob_path != oss_path:
+                duplicate_path, oss_path = oss_path, blob_path
+        cloud_file = _create_uploaded_file(user_id, file_name, parent_id, ancestors, oss_path, file_size, content_hash)
+        release_upload(user_id, reservation_id)
+        if cloud_file is None:
             return json_response_creator(
                 '9',
                 'user storage quota not enough'
             )
-        db.session.add(cloud_file)
-        db.session.commit()
-        invalidate_recent_files_cache(user_id)
+        if duplicate_path:
+            enqueue_oss_purge([duplicate_path])
         return json_response_creator(
             '1',
             'saved success'
@@ -303,12 +582,59 @@ def insert_file():
             'saved failed'
         )
 
+"""
+秒传：已上传过相同内容（SHA-256 与大小均一致）的文件时，直接新建指向该对象的文件记录，无需上传。
+Returns:
+    JSON响应，instant 为 True 表示已完成；为 False 表示没有可复用的对象，需正常上传（上传后在 insert-file 中传入 contentHash）。
+"""
+@file_management.route('/instant-upload/', methods=['POST'])
+@jwt_required()
+@validate_request(
+    required_fields=["fileName", "fileSize", "contentHash"],
+    field_validators={
+        "fileName": InputValidator.validate_file_name,
+        "parentId": InputValidator.validate_file_id,
+        "fileSize": InputValidator.validate_positive_int,
+        "contentHash": InputValidator.validate_content_hash
+    }
+)
+def instant_upload():
+    try:
+        user_id = get_jwt_identity()
+        data = g.validated_data
+        parent_id = data.get('parentId', None)
+        file_size = int(data.get('fileSize'))
+        content_hash = data.get('contentHash')
+        ancestors = get_child_ancestors(user_id, parent_id)
+        if ancestors is None:
+            return json_response_creator('9', 'Parent folder not found')
+        oss_path = acquire_blob(user_id, content_hash, file_size)
+        if oss_path is None:
+            db.session.rollback()
+            return json_response_creator('1', 'upload required', {'instant': False})
+        cloud_file = _create_uploaded_file(user_id, data.get('fileName'), parent_id, ancestors, oss_path, file_size, content_hash)
+        if cloud_file is None:
+            return json_response_creator(
+                '9',
+                'user storage quota not enough'
+            )
+        return json_response_creator('1', 'saved success', {'instant': True})
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'saved failed'
+        )
+
 """
 获取在线编辑文件的内容和父目录ID。
+GET 请求支持条件请求：ETag 由版本号及返回的元信息生成，先只查元信息，与 If-None-Match 一致时返回 304，不读取内容。
+开启写缓冲时返回缓冲区中的内容（可能尚未写入数据库），ETag 中包含缓冲区的版本号。
 Returns:
-    JSON响应，包含 fileContent 和 parentId。
+    JSON响应，包含 fileContent、parentId 和 contentHash（增量保存时作为 baseHash）。
 """
-@file_management.route('/get-online-edit-file/', methods=['POST'])
+@file_management.route('/get-online-edit-file/', methods=['GET', 'POST'])
 @jwt_required()
 @validate_request(
     required_fields=["fileId"],
@@ -320,6 +646,27 @@ def get_online_edit_file():
     try:
         user_id = get_jwt_identity()
         file_id = g.validated_data.get('fileId')
+        meta = db.session.query(
+            Filecontent.version, Filecontent.name, Filecontent.file_suffix, Filecontent.updated_at,
+            Filecontent.deleted_at, Cloudfiles.parent_id
+        ).join(Cloudfiles, Cloudfiles.id == Filecontent.id).filter(
+            Filecontent.id == file_id,
+            Filecontent.user_id == user_id,
+            Cloudfiles.user_id == user_id
+        ).first()
+        if meta is None:
+            return json_response_creator(
+                '9',
+                'file not found'
+            )
+        buffer_version = get_edit_buffer_version(file_id) if _write_behind_enabled() else None
+        if buffer_version is not None and buffer_version < meta.version:
+            # 版本低于数据库的缓冲区是直接写数据库的保存之后留下的，以数据库为准
+            buffer_version = None
+        etag = make_etag('online-edit-file', file_id, *meta, buffer_version)
+        not_modified = not_modified_response(etag)
+        if not_modified is not None:
+            return not_modified
         file_content = Filecontent.query.filter_by(id=file_id, user_id=user_id).first()
         cloud_file = Cloudfiles.query.filter_by(id=file_id, user_id=user_id).first()
         if cloud_file is None or file_content is None:
@@ -327,15 +674,20 @@ def get_online_edit_file():
                 '9',
                 'file not found'
             )
-        return json_response_creator(
+        file_dict = file_content.to_dict()
+        buffered = get_edit_buffer(file_id, with_content=True) if buffer_version is not None else None
+        if buffered is not None:
+            file_dict.update({'content': buffered['content'], 'updated_at': buffered['saved_at'], 'version': buffered['version']})
+        return set_etag_headers(json_response_creator(
             '1',
             'success',
             {
                 'fileId': file_id,
-                'fileContent': file_content.to_dict(),
-                'parentId': cloud_file.parent_id
+                'fileContent': file_dict,
+                'parentId': cloud_file.parent_id,
+                'contentHash': buffered['hash'] if buffered is not None else content_hash(file_dict['content'])
             }
-        )
+        ), etag)
     except Exception as e:
         print(e)
         return json_response_creator(
@@ -369,6 +721,9 @@ def insert_online_edit_file():
         file_size = data.get('fileSize')
 
         file_suffix = get_file_suffix(file_name)
+        ancestors = get_child_ancestors(user_id, folder_id)
+        if ancestors is None:
+            return json_response_creator('9', 'Parent folder not found')
         cloud_file = Cloudfiles(
             id=uuid.uuid4(),
             user_id=user_id,
@@ -377,25 +732,28 @@ def insert_online_edit_file():
             parent_id=folder_id if folder_id else None,
             size=file_size,
             file_suffix=file_suffix,
-            online_editable=True
+            online_editable=True,
+            ancestors=ancestors
         )
         file_content = Filecontent(
             id=cloud_file.id,
             user_id=user_id,
             name=file_name,
-            content=content,
-            file_suffix=file_suffix
+            file_suffix=file_suffix,
+            search_vector=build_search_vector(content)
         )
-        user_storage_quota = UserStorageQuota.query.filter_by(user_id=user_id).first()
-        if not user_storage_quota.increase_online_edit_used(file_size):
+        file_content.set_content(content)
+        if not UserStorageQuota.increase_online_edit_used(user_id, file_size):
             db.session.rollback()
             return json_response_creator(
                 '9',
                 'user storage quota not enough'
             )
         db.session.add_all([cloud_file, file_content])
+        adjust_folder_stats(user_id, ancestors, int(file_size or 0), 1)
         db.session.commit()
-        invalidate_recent_files_cache(user_id)
+        recent_files_upsert(user_id, [cloud_file])
+        invalidate_file_list_cache(user_id, [None, *ancestors])
         return json_response_creator(
             '1',
             'saved success',
@@ -404,7 +762,8 @@ def insert_online_edit_file():
                     'id': file_content.id,
                     'name': file_content.name,
                     'parent_id': cloud_file.parent_id,
-                    'updated_at': file_content.updated_at
+                    'updated_at': file_content.updated_at,
+                    'content_hash': content_hash(content)
                 }
             }
         )
@@ -416,19 +775,40 @@ def insert_online_edit_file():
             'saved failed'
         )
 
+# 写缓冲中有未刷写的内容时先写入数据库：下载、历史版本与直接写数据库的保存都以数据库中的内容为准；
+# Redis 异常时只记录，按数据库中的内容继续
+def _flush_edit_buffer(file_id):
+    try:
+        flush_edit_buffer(file_id)
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+
+# 是否开启在线编辑写缓冲（config.ONLINE_EDIT_WRITE_BEHIND）
+def _write_behind_enabled():
+    return current_app.config.get('ONLINE_EDIT_WRITE_BEHIND', False)
+
 """
 更新在线编辑文件内容和元信息（更新时间、大小）。
+两种提交方式：
+    - 全文：content + fileSize
+    - 增量：patch + baseHash，patch 为相对 baseHash 对应内容的修改段（见 utils.text_patch），
+      服务端校验当前内容的哈希后应用修改并计算大小；哈希不一致或修改无法应用时返回 requireFullContent，前端改为提交全文
+开启写缓冲（ONLINE_EDIT_WRITE_BEHIND）时只写入 Redis 中的文档缓冲区并检查配额，由 jobs.flush_edit_buffers 合并写入数据库（见 utils.edit_buffer）；
+未开启时直接写入数据库。
 Returns:
-    JSON响应，更新结果。
+    JSON响应，file_info 中包含保存后内容的 content_hash 与版本号。
 """
 @file_management.route('/update-online-edit-file/', methods=['POST'])
 @jwt_required()
 @validate_request(
-    required_fields=["fileId", "fileSize"],
+    required_fields=["fileId"],
     field_validators={
         "fileId": InputValidator.validate_file_id_not_none,
         "content": InputValidator.validate_file_content,
-        "fileSize": InputValidator.validate_positive_int
+        "fileSize": InputValidator.validate_positive_int,
+        "baseHash": InputValidator.validate_content_hash,
+        "patch": InputValidator.validate_patch_ops
     }
 )
 def update_online_edit_file():
@@ -436,39 +816,81 @@ def update_online_edit_file():
         user_id = get_jwt_identity()
         data = g.validated_data
         file_id = data.get('fileId')
-        content = data.get('content', '')
-        file_size = data.get('fileSize')
-        cloud_file = Cloudfiles.query.filter_by(id=file_id, user_id=user_id).first()
-        file_content = Filecontent.query.filter_by(id=cloud_file.id, user_id=user_id).first()
-        if cloud_file is None or file_content is None:
+        patch = data.get('patch')
+        base_hash = data.get('baseHash')
+        if patch is None and ('content' not in data or 'fileSize' not in data):
+            return json_response_creator('2', 'content and fileSize are required')
+        if patch is not None and base_hash is None:
+            return json_response_creator('2', 'baseHash is required')
+        if not _write_behind_enabled():
+            return _update_online_edit_file_in_db(user_id, file_id, data)
+        context = get_save_context(user_id, file_id)
+        if context is None:
             return json_response_creator(
                 '9',
                 'file not found'
             )
-        user_storage_quota = UserStorageQuota.query.filter_by(user_id=user_id).first()
-        if not user_storage_quota.replace_online_upload_used(cloud_file.size, file_size):
-            db.session.rollback()
+        # 缓冲区在读取与写入之间过期时重新建立，再试一次
+        for _ in range(2):
+            state = get_edit_buffer(file_id, with_content=patch is not None)
+            if state is not None and state['version'] < context.version:
+                # 直接写数据库的保存之后留下的旧缓冲区，删除后按数据库重新建立
+                discard_stale_edit_buffer(file_id, context.version)
+                state = None
+            state = state or init_edit_buffer(user_id, file_id)
+            if state is None:
+                return json_response_creator(
+                    '9',
+                    'file not found'
+                )
+            if patch is not None:
+                if state['hash'] != base_hash:
+                    return json_response_creator(
+                        '9',
+                        'base content changed',
+                        {'requireFullContent': True, 'contentHash': state['hash']}
+                    )
+                try:
+                    content = apply_patch(state['content'], patch)
+                except ValueError as e:
+                    print(e)
+                    return json_response_creator('9', 'patch failed', {'requireFullContent': True})
+                if not InputValidator.validate_file_content(content):
+                    return json_response_creator('2', 'content is invalid')
+                file_size = len(content.encode('utf-8'))
+            else:
+                content = data.get('content', '')
+                file_size = data.get('fileSize')
+            result, value = save_edit_buffer(user_id, file_id, content, file_size, context, base_hash if patch is not None else None)
+            if result != EDIT_BUFFER_MISSING:
+                break
+        if result == EDIT_BUFFER_CONFLICT:
+            return json_response_creator(
+                '9',
+                'base content changed',
+                {'requireFullContent': True, 'contentHash': value}
+            )
+        if result == EDIT_BUFFER_QUOTA_EXCEEDED:
             return json_response_creator(
                 '9',
                 'user storage quota not enough'
             )
-        current_time = datetime.now()
-        cloud_file.updated_at = current_time
-        cloud_file.size = file_size
-        file_content.updated_at = current_time
-        file_content.content = content
-        db.session.add_all([cloud_file, file_content])
-        db.session.commit()
-        invalidate_recent_files_cache(user_id)
+        if result == EDIT_BUFFER_MISSING:
+            return json_response_creator(
+                '9',
+                'updated failed'
+            )
         return json_response_creator(
             '1',
             'updated success',
             {
                 'file_info': {
-                    'id': file_content.id,
-                    'name': file_content.name,
-                    'parent_id': cloud_file.parent_id,
-                    'updated_at': current_time
+                    'id': file_id,
+                    'name': context.name,
+                    'parent_id': context.parent_id,
+                    'updated_at': value,
+                    'content_hash': content_hash(content),
+                    'version': result
                 }
             }
         )
@@ -480,6 +902,193 @@ def update_online_edit_file():
             'updated failed'
         )
 
+# 未开启写缓冲时的保存：直接写入数据库
+def _update_online_edit_file_in_db(user_id, file_id, data):
+    patch = data.get('patch')
+    base_hash = data.get('baseHash')
+    # 之前开启写缓冲时留下的未刷写内容先写入，避免之后被刷写覆盖
+    _flush_edit_buffer(file_id)
+    cloud_file = Cloudfiles.query.filter_by(id=file_id, user_id=user_id).first()
+    # 锁定内容行，并发的增量保存依次校验哈希，不会基于同一版本各自应用
+    file_content = Filecontent.query.filter_by(id=file_id, user_id=user_id).with_for_update().first()
+    if cloud_file is None or file_content is None:
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'file not found'
+        )
+    old_content = file_content.get_content()
+    if patch is not None:
+        current_hash = content_hash(old_content)
+        if current_hash != base_hash:
+            db.session.rollback()
+            return json_response_creator(
+                '9',
+                'base content changed',
+                {'requireFullContent': True, 'contentHash': current_hash}
+            )
+        try:
+            content = apply_patch(old_content, patch)
+        except ValueError as e:
+            print(e)
+            db.session.rollback()
+            return json_response_creator('9', 'patch failed', {'requireFullContent': True})
+        if not InputValidator.validate_file_content(content):
+            db.session.rollback()
+            return json_response_creator('2', 'content is invalid')
+        file_size = len(content.encode('utf-8'))
+    else:
+        content = data.get('content', '')
+        file_size = data.get('fileSize')
+    if not UserStorageQuota.replace_online_upload_used(user_id, cloud_file.size, file_size):
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'user storage quota not enough'
+        )
+    if cloud_file.deleted_at is None:
+        adjust_folder_stats(user_id, cloud_file.ancestors, int(file_size) - (cloud_file.size or 0))
+    # 被覆盖的内容记为历史版本，需在更新 updated_at 之前调用
+    record_revision(file_content, old_content, content)
+    current_time = datetime.now()
+    cloud_file.updated_at = current_time
+    cloud_file.size = file_size
+    file_content.updated_at = current_time
+    file_content.set_content(content)
+    file_content.search_vector = build_search_vector(content)
+    db.session.add_all([cloud_file, file_content])
+    db.session.commit()
+    # 刷写后留下的干净缓冲区已不是最新内容，删除，避免之后开启写缓冲或导出 ZIP 时读到旧内容
+    discard_edit_buffers(user_id, [file_id])
+    if cloud_file.deleted_at is None:
+        recent_files_upsert(user_id, [cloud_file])
+    invalidate_file_list_cache(user_id, [None, *cloud_file.ancestors])
+    return json_response_creator(
+        '1',
+        'updated success',
+        {
+            'file_info': {
+                'id': file_content.id,
+                'name': file_content.name,
+                'parent_id': cloud_file.parent_id,
+                'updated_at': current_time,
+                'content_hash': content_hash(content),
+                'version': file_content.version
+            }
+        }
+    )
+
+"""
+编辑器关闭（切换文件、离开页面）时调用，立即把该文件写缓冲中未刷写的内容写入数据库。
+Returns:
+    JSON响应，flushed 表示是否有内容写入。
+"""
+@file_management.route('/flush-online-edit-file/', methods=['POST'])
+@jwt_required()
+@validate_request(
+    required_fields=["fileId"],
+    field_validators={
+        "fileId": InputValidator.validate_file_id_not_none
+    }
+)
+def flush_online_edit_file():
+    try:
+        user_id = get_jwt_identity()
+        file_id = g.validated_data.get('fileId')
+        if db.session.query(Filecontent.id).filter_by(id=file_id, user_id=user_id).first() is None:
+            return json_response_creator('9', 'file not found')
+        db.session.rollback()
+        return json_response_creator('1', 'flushed success', {'flushed': flush_edit_buffer(file_id)})
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'flushed failed'
+        )
+
+"""
+获取在线编辑文件的历史版本列表（不含最新版本），按版本号降序。
+写缓冲中未刷写的内容先写入数据库（记为最新版本）。
+Returns:
+    JSON响应，包含 current_version 与 revisions（每项含 revision、size、saved_at）。
+"""
+@file_management.route('/file-revisions/')
+@jwt_required()
+@validate_request(
+    required_fields=["fileId"],
+    field_validators={
+        "fileId": InputValidator.validate_file_id_not_none
+    }
+)
+def file_revisions():
+    try:
+        user_id = get_jwt_identity()
+        file_id = g.validated_data.get('fileId')
+        _flush_edit_buffer(file_id)
+        current = db.session.query(Filecontent.version, Filecontent.updated_at).filter_by(id=file_id, user_id=user_id).first()
+        if current is None:
+            return json_response_creator('9', 'file not found')
+        return json_response_creator(
+            '1',
+            'success',
+            {
+                'current_version': current.version,
+                'current_saved_at': current.updated_at,
+                'revisions': [row._asdict() for row in list_revisions(file_id)]
+            }
+        )
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'Database error'
+        )
+
+"""
+获取在线编辑文件指定历史版本的内容。
+Returns:
+    JSON响应，包含 revision、content 与 contentHash。
+"""
+@file_management.route('/get-file-revision/', methods=['POST'])
+@jwt_required()
+@validate_request(
+    required_fields=["fileId", "revision"],
+    field_validators={
+        "fileId": InputValidator.validate_file_id_not_none,
+        "revision": InputValidator.validate_positive_int
+    }
+)
+def get_file_revision():
+    try:
+        user_id = get_jwt_identity()
+        file_id = g.validated_data.get('fileId')
+        revision = int(g.validated_data.get('revision'))
+        _flush_edit_buffer(file_id)
+        file_content = Filecontent.query.filter_by(id=file_id, user_id=user_id).first()
+        if file_content is None:
+            return json_response_creator('9', 'file not found')
+        current_content = file_content.get_content()
+        if revision == file_content.version:
+            content = current_content
+        else:
+            content = get_revision_content(file_content.id, revision, current_content)
+            if content is None:
+                return json_response_creator('9', 'revision not found')
+        return json_response_creator(
+            '1',
+            'success',
+            {'revision': revision, 'content': content, 'contentHash': content_hash(content)}
+        )
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return json_response_creator(
+            '9',
+            'Database error'
+        )
+
 """
 获取指定 OSS 文件路径的临时预览URL。
 Returns:
@@ -508,9 +1117,9 @@ def get_preview_temp_path():
     )
 
 """
-逻辑删除文件或文件夹（设置 deleted_at 字段），支持递归。
+逻辑删除文件或文件夹（设置 deleted_at 字段），连同所有子孙一次性删除。
 Returns:
-    JSON响应，删除结果。
+    JSON响应，删除结果，包含 deleted_count（被逻辑删除的文件/文件夹数）。
 """
 @file_management.route('/delete-file/', methods=['POST'])
 @jwt_required()
@@ -526,35 +1135,33 @@ def logical_delete_file():
         file_id = g.validated_data.get('id')
         if not file_id:
             return json_response_creator('9', 'Missing file ID')
-        now = datetime.now()
-        def recursive_logical_delete(fid):
-            item = Cloudfiles.query.filter_by(id=fid, user_id=user_id).first()
-            if not item:
-                return
-            item.deleted_at = now
-            db.session.add(item)
-            if not item.is_folder and item.online_editable: # 在线编辑文件
-                content_record = Filecontent.query.filter_by(id=fid, user_id=user_id).first()
-                if content_record:
-                    content_record.deleted_at = now
-                    db.session.add(content_record)
-            if item.is_folder: # 文件夹递归删除
-                children = Cloudfiles.query.filter_by(parent_id=fid, user_id=user_id).all()
-                for child in children:
-                    recursive_logical_delete(child.id)
-        recursive_logical_delete(file_id)
+        target = db.session.query(Cloudfiles.is_folder, Cloudfiles.ancestors).filter_by(id=file_id, user_id=user_id).first()
+        if target is None:
+            return json_response_creator('9', 'File or folder not found')
+        # 子树内的 cloudfiles 与在线编辑文件的 filecontent 各一条UPDATE，同一事务提交
+        deleted_count = logical_delete_subtree(user_id, file_id, datetime.now())
+        if deleted_count == 0:
+            db.session.rollback()
+            return json_response_creator('9', 'File or folder not found')
         db.session.commit()
-        invalidate_recent_files_cache(user_id)
-        return json_response_creator('1', 'Logical delete success')
+        if target.is_folder:
+            recent_files_reset(user_id)
+        else:
+            recent_files_remove(user_id, [file_id])
+        invalidate_recycle_bin_count(user_id)
+        # 删除文件夹时子树内的列表均变化，按用户整体失效
+        invalidate_file_list_cache(user_id, None if target.is_folder else [None, *target.ancestors])
+        return json_response_creator('1', 'Logical delete success', {'deleted_count': deleted_count})
     except Exception as e:
         print(e)
         db.session.rollback()
         return json_response_creator('9', 'Logical delete failed')
 
 """
-物理删除文件或文件夹（彻底从数据库中删除），支持递归。
+物理删除文件或文件夹（彻底从数据库中删除），连同所有子孙批量删除。
+OSS对象放入删除队列，由 oss-purge-worker 异步批量删除。
 Returns:
-    JSON响应，删除结果。
+    JSON响应，删除结果，包含 deleted_count。
 """
 @file_management.route('/hard-delete-file/', methods=['POST'])
 @jwt_required()
@@ -570,28 +1177,31 @@ def hard_delete_file():
         file_id = g.validated_data.get('id')
         if not file_id:
             return json_response_creator('9', 'Missing file ID')
-        def recursive_hard_delete(fid):
-            item = Cloudfiles.query.filter_by(id=fid, user_id=user_id).first()
-            if not item:
-                return
-            if item.is_folder:
-                children = Cloudfiles.query.filter_by(parent_id=fid, user_id=user_id).all()
-                for child in children:
-                    recursive_hard_delete(child.id)
-            else:
-                # 删除 file_content 中的内容（如果是文件）
-                user_storage_quota = UserStorageQuota.query.filter_by(user_id=user_id).first()
-                if item.online_editable:
-                    Filecontent.query.filter_by(id=fid, user_id=user_id).delete()
-                    user_storage_quota.decrease_online_edit_used(item.size)
-                else:
-                    if delete_file(item.oss_path):  # 删除OSS文件
-                        print(f'{item.oss_path}删除成功')
-                    user_storage_quota.decrease_upload_used(item.size)
-            db.session.delete(item)
-        recursive_hard_delete(file_id)
+        target = db.session.query(Cloudfiles.is_folder, Cloudfiles.ancestors).filter_by(id=file_id, user_id=user_id).first()
+        if target is None:
+            return json_response_creator('9', 'File or folder not found')
+        # 批量删除 filecontent 与 cloudfiles，取回被删文件的大小与OSS路径
+        deleted = hard_delete_subtree(user_id, file_id)
+        if deleted['deleted_count'] == 0:
+            db.session.rollback()
+            return json_response_creator('9', 'File or folder not found')
+        # 配额按合计大小一次性扣除
+        if deleted['online_edit_size']:
+            UserStorageQuota.decrease_online_edit_used(user_id, deleted['online_edit_size'])
+        if deleted['upload_size']:
+            UserStorageQuota.decrease_upload_used(user_id, deleted['upload_size'])
         db.session.commit()
-        return json_response_creator('1', 'Hard delete success')
+        apply_upload_used_delta(user_id, -deleted['upload_size'])
+        discard_edit_buffers(user_id, deleted['online_edit_ids'])
+        invalidate_recycle_bin_count(user_id)
+        invalidate_file_list_cache(user_id, None if target.is_folder else [None, *target.ancestors])
+        if target.is_folder:
+            recent_files_reset(user_id)
+        else:
+            recent_files_remove(user_id, [file_id])
+        # 提交成功后再将OSS对象放入删除队列，避免回滚后对象已被删除
+        enqueue_oss_purge(deleted['oss_paths'])
+        return json_response_creator('1', 'Hard delete success', {'deleted_count': deleted['deleted_count']})
     except Exception as e:
         print(e)
         db.session.rollback()
@@ -647,14 +1257,19 @@ def create_folder():
         ).first()
         if existing:
             return json_response_creator('9', 'Folder already exists with the same name')
+        ancestors = get_child_ancestors(user_id, parent_id)
+        if ancestors is None:
+            return json_response_creator('9', 'Parent folder not found')
         new_folder = Cloudfiles(
             user_id=user_id,
             name=folder_name,
             is_folder=True,
-            parent_id=parent_id
+            parent_id=parent_id,
+            ancestors=ancestors
         )
         db.session.add(new_folder)
         db.session.commit()
+        invalidate_file_list_cache(user_id, [parent_id])
         return json_response_creator(
             '1',
             'Folder created successfully',
@@ -708,22 +1323,14 @@ def move_file():
         if not target:
             return json_response_creator('9', 'File or folder not found')
         # 验证新父文件夹存在且为文件夹（允许 new_parent_id 为 None）
+        new_parent = None
         if new_parent_id is not None:
             new_parent = Cloudfiles.query.filter_by(id=new_parent_id, user_id=user_id, is_folder=True, deleted_at=None).first()
             if not new_parent:
                 return json_response_creator('9', 'Target folder not found or is not a folder')
-        # 防止移动到自身或其子孙节点中（只针对文件夹）
-        if target.is_folder and new_parent_id:
-            def is_descendant(child_id, potential_ancestor_id):
-                while child_id:
-                    current = Cloudfiles.query.filter_by(id=child_id, user_id=user_id).first()
-                    if not current:
-                        break
-                    if current.parent_id == potential_ancestor_id:
-                        return True
-                    child_id = current.parent_id
-                return False
-            if file_id == new_parent_id or is_descendant(new_parent_id, file_id):
+        # 防止移动到自身或其子孙节点中（只针对文件夹），祖先链中含自身即为子孙节点
+        if target.is_folder and new_parent is not None:
+            if new_parent.id == target.id or is_ancestor(target.id, new_parent):
                 return json_response_creator('9', 'Cannot move a folder into itself or its subfolder')
         # 检查是否存在命名冲突
         conflict = Cloudfiles.query.filter_by(
@@ -734,16 +1341,19 @@ def move_file():
         ).first()
         if conflict:
             return json_response_creator('9', 'A file or folder with the same name already exists in the target folder')
-        # 执行移动操作
-        old_parent_id = target.parent_id
+        # 执行移动操作，连同子孙节点的祖先链一并更新
+        new_ancestors = list(new_parent.ancestors or []) + [new_parent.id] if new_parent is not None else []
+        old_ancestors = list(target.ancestors or [])
+        move_subtree(user_id, target.id, old_ancestors, new_ancestors)
         target.parent_id = new_parent_id
         target.updated_at = datetime.now()
         db.session.commit()
-        # 清除路径缓存（旧的父路径、新的父路径、当前对象）
-        unset_folder_path_cache(old_parent_id)
-        unset_folder_path_cache(new_parent_id)
-        unset_folder_path_cache(target.id)
-        invalidate_recent_files_cache(user_id)
+        # 清除路径缓存（子孙节点的路径均已变化，按用户整体失效）
+        invalidate_folder_path_cache(user_id)
+        if not target.is_folder:
+            recent_files_upsert(user_id, [target])
+        # 子树内部的列表不变，只有新旧两条祖先链上的列表（含 tree_size）变化
+        invalidate_file_list_cache(user_id, [None, *old_ancestors, *new_ancestors])
         return json_response_creator('1', 'Move success')
     except Exception as e:
         print(e)
@@ -755,8 +1365,10 @@ def move_file():
 请求参数 (JSON):
     id (str): 要恢复的文件或文件夹 ID。
 功能说明:
-    - 文件夹：递归恢复所有子文件夹及文件；
-    - 文件：恢复自身，如果原父文件夹被逻辑删除，则递归恢复该文件的所有父文件夹；
+    - 文件夹：一条UPDATE恢复所有已删除的子文件夹及文件；
+    - 文件/文件夹：如果祖先文件夹被逻辑删除，则按 ancestors 一并恢复；
+    - 恢复前一次性检查所有待恢复项与现有文件/文件夹是否重名；
+    - 在线编辑文件的 filecontent 同时恢复；
     - 恢复路径按 parent_id 恢复，无视路径变更；
     - 返回恢复路径详情，供前端确认。
 返回:
@@ -790,32 +1402,19 @@ def restore_item():
         target = Cloudfiles.query.filter_by(id=target_id, user_id=user_id).first()
         if not target or target.deleted_at is None:
             return json_response_creator('9', 'File or folder not found or not deleted')
-        restored_ids = []
-        # 恢复文件夹及其所有子内容
-        def restore_folder_recursive(folder):
-            folder.deleted_at = None
-            restored_ids.append(folder.name)
-            children = Cloudfiles.query.filter_by(user_id=user_id, parent_id=folder.id).all()
-            for child in children:
-                if child.deleted_at is not None:
-                    if child.is_folder:
-                        restore_folder_recursive(child)
-                    else:
-                        child.deleted_at = None
-                        restored_ids.append(child.name)
-        # 恢复文件（递归恢复其父文件夹）
-        def restore_file(file):
-            current = file
-            while current:
-                if current.deleted_at is not None:
-                    current.deleted_at = None
-                    restored_ids.append(current.name)
-                current = Cloudfiles.query.filter_by(id=current.parent_id, user_id=user_id).first()
-        if target.is_folder:
-            restore_folder_recursive(target)
-        else:
-            restore_file(target)
+        # 同名冲突检查（子树 + 已删除的祖先文件夹，一次查询）
+        conflicts = find_restore_conflicts(user_id, target)
+        if conflicts:
+            return json_response_creator(
+                '9',
+                'A file or folder with the same name already exists',
+                {'conflicts': conflicts}
+            )
+        restored_ids = [row.name for row in restore_subtree(user_id, target)]
         db.session.commit()
+        invalidate_recycle_bin_count(user_id)
+        recent_files_reset(user_id)
+        invalidate_file_list_cache(user_id, None if target.is_folder else [None, *target.ancestors])
         # 获取恢复后的路径
         full_path = get_path_from_parent_folder(target)
         return json_response_creator(
@@ -884,6 +1483,12 @@ def rename_file_or_folder():
                 file_content.updated_at = datetime.now()
                 file_content.file_suffix = get_file_suffix(new_name)
         db.session.commit()
+        # 文件夹重命名后其子孙节点的路径均已变化
+        if target.is_folder:
+            invalidate_folder_path_cache(user_id)
+        if not target.is_folder:
+            recent_files_upsert(user_id, [target])
+        invalidate_file_list_cache(user_id, [target.parent_id])
         return json_response_creator('1', 'Rename success', target.to_dict())
     except Exception as e:
         print(e)
@@ -934,23 +1539,43 @@ def download_file():
     except Exception as e:
         print(e)
         return json_response_creator('9', 'Key解密失败')
+    # key 在有效期（10分钟）内可重复使用，断点续传、分段下载时会以同一链接发起多次 Range 请求
     file_id = redis_client.get(raw_key)
-    redis_client.delete(raw_key)
     if not file_id:
         return json_response_creator('9', 'Invalid or expired key')
     file_id = file_id.decode() if hasattr(file_id, "decode") else file_id
-    file_content = Filecontent.query.filter_by(id=file_id, deleted_at=None).first()
-    if not file_content:
+    _flush_edit_buffer(file_id)
+    info = get_content_stream_info(file_id)
+    if info is None:
         return json_response_creator('9', 'File not found')
-    # 以文件下载方式返回
-    file_stream = io.BytesIO(file_content.content.encode("utf-8"))
-    response = make_response(send_file(
-        file_stream,
-        as_attachment=True,
-        download_name=file_content.name or "download.txt",
-        mimetype="application/octet-stream"
-    ))
-    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(file_content.name) or 'download.txt'}"
+    # 内容分块读取、编码后流式返回，支持单段 Range；If-Range 与 ETag（文件ID + 版本号）不一致时返回全文
+    etag = f"{info.id}-{info.version}"
+    start, stop, status = 0, None, 200
+    headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(info.name or '') or 'download.txt'}"}
+    if info.size is not None:
+        stop = info.size
+        headers["Accept-Ranges"] = "bytes"
+        if_range = request.if_range
+        range_applies = (if_range.etag is None and if_range.date is None) or if_range.etag == etag
+        if request.range is not None and range_applies:
+            requested = request.range.range_for_length(info.size) if request.range.units == 'bytes' else None
+            if requested is None:
+                return Response(status=416, headers={"Content-Range": f"bytes */{info.size}"})
+            start, stop = requested
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{info.size}"
+        headers["Content-Length"] = str(stop - start)
+
+    def generate():
+        try:
+            yield from iter_content_range(info, start, stop)
+        except ContentChangedError as e:
+            # 已发送部分内容，只能中断连接，客户端按 Content-Length 判断下载不完整
+            print(e)
+            raise
+
+    response = Response(stream_with_context(generate()), status=status, headers=headers, mimetype="application/octet-stream")
+    response.set_etag(etag)
     return response
 
 @file_management.route('/share-file/', methods=['GET'])
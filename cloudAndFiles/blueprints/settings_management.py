@@ -2,7 +2,7 @@ from flask import Blueprint, request, g
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from models import SystemConfig
 from extensions import db
-from utils.utils import json_response_creator
+from utils.utils import json_response_creator, get_file_list_cache_stats
 from utils.filed_check import validate_request
 from utils.oss_access import get_bucket_stat
 
@@ -76,3 +76,18 @@ def get_oss_info():
     except Exception as e:
         print(e)
         return json_response_creator("9", "Error getting OSS info")
+
+@settings_management.route('/file-list-cache-stat/', methods=['GET'])
+@jwt_required()
+def get_file_list_cache_stat():
+    """
+    获取文件列表缓存的命中次数、未命中次数、命中率与失效次数。
+    需要管理员权限。
+    """
+    try:
+        if get_jwt()["user_group"] != "admin":
+            return json_response_creator("9", "Permission denied")
+        return json_response_creator("1", "success", get_file_list_cache_stats())
+    except Exception as e:
+        print(e)
+        return json_response_creator("9", "Error getting file list cache stat")
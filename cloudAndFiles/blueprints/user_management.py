@@ -12,6 +12,7 @@ from models import Users, UserStorageQuota, SystemConfig
 from utils.utils import verify_password_hash, json_response_creator, check_captcha, set_captcha, send_captcha_email, email_usable_validator, generate_password_hash, generate_mail_html, generate_base64_id
 from datetime import datetime
 from utils.filed_check import validate_request, InputValidator
+from utils.quota import invalidate_quota_mirror
 import uuid
 
 user_management = Blueprint('user_management', __name__, url_prefix='/user-management')
@@ -309,6 +310,7 @@ def update_user_storage_quota():
             return json_response_creator("9", "User storage quota not found")
         quota.update_limits(online_edit_limit=online_edit_limit, upload_limit=upload_limit)
         db.session.commit()
+        invalidate_quota_mirror(user_id)
         return json_response_creator("1", "User storage quota updated", quota.to_dict())
     except Exception as e:
         db.session.rollback()
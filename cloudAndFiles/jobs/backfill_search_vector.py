@@ -0,0 +1,40 @@
+# 为已有的在线编辑文件生成 filecontent.search_vector
+# 中日韩文字的二元组切分在 Python 中完成，无法只用一条 SQL 回填，因此按批处理
+# 用法（在 cloudAndFiles 目录下）：python -m jobs.backfill_search_vector [批大小]
+import sys
+from app import app
+from extensions import db
+from models import Filecontent
+from utils.text_search import build_search_vector
+from utils.content_codec import decode_content
+
+DEFAULT_BATCH_SIZE = 200
+
+
+def backfill(batch_size=DEFAULT_BATCH_SIZE):
+    total = 0
+    last_id = None
+    while True:
+        query = db.session.query(
+            Filecontent.id, Filecontent.content, Filecontent.content_codec, Filecontent.content_blob
+        ).filter(Filecontent.search_vector.is_(None))
+        if last_id is not None:
+            query = query.filter(Filecontent.id > last_id)
+        rows = query.order_by(Filecontent.id).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            db.session.query(Filecontent).filter(Filecontent.id == row.id).update(
+                {Filecontent.search_vector: build_search_vector(decode_content(row.content_codec, row.content, row.content_blob))},
+                synchronize_session=False
+            )
+        db.session.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+        print(f"backfilled {total} rows")
+    return total
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        backfill(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE)
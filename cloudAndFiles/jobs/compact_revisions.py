@@ -0,0 +1,99 @@
+# 在线编辑文件历史版本的保留与压缩
+#   - 保存时间早于 --delete-after-days 天的历史版本直接删除（旧版本只依赖更新的版本，删除最旧的版本不影响其余版本）
+#   - 保存时间早于 --thin-after-days 天的历史版本每天只保留最后一个，被移除版本以下的版本按新的相邻关系重新编码
+# 用法（在 cloudAndFiles 目录下）：
+#   python -m jobs.compact_revisions [--thin-after-days 7] [--delete-after-days 180] [--dry-run]
+import argparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from app import app
+from extensions import db
+from models import Filecontent, FilecontentRevisions
+from utils.revisions import iter_revision_contents, encode_revision, REVISION_KIND_FULL
+
+DEFAULT_THIN_AFTER_DAYS = 7
+DEFAULT_DELETE_AFTER_DAYS = 180
+
+DELETE_EXPIRED_SQL = text("""
+    DELETE FROM filecontent_revisions WHERE saved_at < :cutoff
+""")
+
+COUNT_EXPIRED_SQL = text("""
+    SELECT COUNT(*) FROM filecontent_revisions WHERE saved_at < :cutoff
+""")
+
+THIN_CANDIDATE_FILES_SQL = text("""
+    SELECT file_id FROM filecontent_revisions
+    WHERE saved_at < :cutoff
+    GROUP BY file_id
+    HAVING COUNT(*) > COUNT(DISTINCT saved_at::date)
+""")
+
+
+def _revisions_to_remove(rows, cutoff):
+    # 早于 cutoff 的版本按保存日期分组，每组只保留版本号最大的一个
+    by_day = defaultdict(list)
+    for row in rows:
+        if row.saved_at and row.saved_at < cutoff:
+            by_day[row.saved_at.date()].append(row.revision)
+    removed = set()
+    for revisions in by_day.values():
+        removed.update(sorted(revisions)[:-1])
+    return removed
+
+# 稀疏化一个文件的历史版本，返回移除的版本数；不提交事务
+def thin_file(file_id, cutoff, dry_run=False):
+    # 锁定内容行，避免与保存（会改写最新的历史版本）并发
+    file_content = Filecontent.query.filter_by(id=file_id).with_for_update().first()
+    if file_content is None:
+        return 0
+    rows = FilecontentRevisions.query.filter_by(file_id=file_id).order_by(FilecontentRevisions.revision.desc()).all()
+    removed = _revisions_to_remove(rows, cutoff)
+    if not removed or dry_run:
+        return len(removed)
+    newest_removed = max(removed)
+    newer_content = file_content.get_content()
+    deltas_above = 0
+    for row, content in iter_revision_contents(newer_content, rows):
+        if row.revision in removed:
+            db.session.delete(row)
+            continue
+        # 被移除版本以下的版本，其相邻的更新版本变了，重新编码
+        if row.revision < newest_removed:
+            row.kind, row.data = encode_revision(content, newer_content, deltas_above)
+        deltas_above = 0 if row.kind == REVISION_KIND_FULL else deltas_above + 1
+        newer_content = content
+    return len(removed)
+
+
+def compact(thin_after_days=DEFAULT_THIN_AFTER_DAYS, delete_after_days=DEFAULT_DELETE_AFTER_DAYS, dry_run=False):
+    now = datetime.now()
+    delete_cutoff = now - timedelta(days=delete_after_days)
+    if dry_run:
+        expired = db.session.execute(COUNT_EXPIRED_SQL, {'cutoff': delete_cutoff}).scalar()
+    else:
+        expired = db.session.execute(DELETE_EXPIRED_SQL, {'cutoff': delete_cutoff}).rowcount
+        db.session.commit()
+    print(f"{expired} expired revisions deleted")
+    thin_cutoff = now - timedelta(days=thin_after_days)
+    file_ids = [row.file_id for row in db.session.execute(THIN_CANDIDATE_FILES_SQL, {'cutoff': thin_cutoff})]
+    thinned = 0
+    for file_id in file_ids:
+        thinned += thin_file(file_id, thin_cutoff, dry_run)
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    print(f"{thinned} revisions thinned in {len(file_ids)} files")
+    return expired, thinned
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--thin-after-days', type=int, default=DEFAULT_THIN_AFTER_DAYS)
+    parser.add_argument('--delete-after-days', type=int, default=DEFAULT_DELETE_AFTER_DAYS)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    with app.app_context():
+        compact(args.thin_after_days, args.delete_after_days, args.dry_run)
@@ -0,0 +1,58 @@
+# 将已有的未压缩在线编辑文件内容按 utils.content_codec 的规则压缩存储
+# 按 id 分批读取、在 Python 中压缩后批量写回；写回时校验 updated_at 未变化，期间被保存过的行跳过，下次执行时再处理
+# 较短或压缩后没有变小的内容保持原样
+# 用法（在 cloudAndFiles 目录下）：python -m jobs.compress_filecontent [批大小]
+# 执行完成后可 VACUUM filecontent 回收空间
+import sys
+from sqlalchemy import text
+from app import app
+from extensions import db
+from models import Filecontent
+from utils.content_codec import encode_content
+
+DEFAULT_BATCH_SIZE = 200
+
+COMPRESS_ROW_SQL = text("""
+    UPDATE filecontent
+    SET content_codec = :codec, content_blob = :blob, content_size = :size, content = NULL
+    WHERE id = :id AND content_codec IS NULL AND updated_at IS NOT DISTINCT FROM :updated_at
+""")
+
+
+def compress(batch_size=DEFAULT_BATCH_SIZE):
+    scanned = 0
+    compressed = 0
+    raw_bytes = 0
+    compressed_bytes = 0
+    last_id = None
+    while True:
+        query = db.session.query(Filecontent.id, Filecontent.content, Filecontent.updated_at).filter(
+            Filecontent.content_codec.is_(None),
+            Filecontent.content.isnot(None)
+        )
+        if last_id is not None:
+            query = query.filter(Filecontent.id > last_id)
+        rows = query.order_by(Filecontent.id).limit(batch_size).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            codec, _, blob, size = encode_content(row.content)
+            if codec is None:
+                continue
+            params.append({'id': row.id, 'codec': codec, 'blob': blob, 'size': size, 'updated_at': row.updated_at})
+            raw_bytes += size
+            compressed_bytes += len(blob)
+        if params:
+            db.session.execute(COMPRESS_ROW_SQL, params)
+        db.session.commit()
+        scanned += len(rows)
+        compressed += len(params)
+        last_id = rows[-1].id
+        print(f"scanned {scanned} rows, compressed {compressed} rows ({raw_bytes} -> {compressed_bytes} bytes)")
+    return compressed
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        compress(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE)
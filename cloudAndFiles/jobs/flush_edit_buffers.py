@@ -0,0 +1,51 @@
+# 在线编辑写缓冲的刷写
+#   每轮把首次未刷写的保存早于 --interval 秒的文档写入数据库，每个文档一次写入（连续的保存合并为一次），见 utils.edit_buffer
+#   常驻运行（如 systemd），编辑器关闭时 /flush-online-edit-file/ 会立即刷写该文档
+# 用法（在 cloudAndFiles 目录下）：
+#   python -m jobs.flush_edit_buffers [--interval 30] [--batch-size 100] [--once]
+#   关闭写缓冲（ONLINE_EDIT_WRITE_BEHIND = False）后执行一次 --interval 0 --once，写入全部未刷写的内容
+import argparse
+import time
+from app import app
+from extensions import db
+from utils.edit_buffer import flush_edit_buffer, get_due_edit_buffers, EDIT_BUFFER_FLUSH_INTERVAL
+
+DEFAULT_BATCH_SIZE = 100
+# 没有到期的文档时的等待时间
+IDLE_SLEEP = 1
+
+
+def flush_due(interval=EDIT_BUFFER_FLUSH_INTERVAL, batch_size=DEFAULT_BATCH_SIZE):
+    flushed = 0
+    file_ids = get_due_edit_buffers(interval, batch_size)
+    for file_id in file_ids:
+        try:
+            flushed += flush_edit_buffer(file_id)
+        except Exception as e:
+            # 单个文档失败不影响其他文档，下一轮重试
+            print(f"flush {file_id} failed: {e}")
+            db.session.rollback()
+    return len(file_ids), flushed
+
+
+def run(interval=EDIT_BUFFER_FLUSH_INTERVAL, batch_size=DEFAULT_BATCH_SIZE, once=False):
+    while True:
+        due, flushed = flush_due(interval, batch_size)
+        if due:
+            print(f"{flushed} of {due} due edit buffers flushed")
+        if once:
+            # --once 时处理完全部到期的文档再退出；失败的文档仍在队列中，只处理一轮
+            if due < batch_size or flushed == 0:
+                return
+        elif due < batch_size:
+            time.sleep(IDLE_SLEEP)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=int, default=EDIT_BUFFER_FLUSH_INTERVAL)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--once', action='store_true')
+    args = parser.parse_args()
+    with app.app_context():
+        run(args.interval, args.batch_size, args.once)
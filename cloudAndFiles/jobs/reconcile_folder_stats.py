@@ -0,0 +1,62 @@
+# 文件夹聚合统计（tree_size / tree_file_count）的对账修复
+# 增量维护在异常中断、手工改数据等情况下可能产生偏差，定期按用户全量重算并修正不一致的文件夹
+# 用法（在 cloudAndFiles 目录下）：python -m jobs.reconcile_folder_stats [user_id ...]
+import sys
+from sqlalchemy import text
+from app import app
+from extensions import db
+
+USERS_WITH_FOLDERS_SQL = text("""
+    SELECT DISTINCT user_id FROM cloudfiles WHERE is_folder = TRUE
+""")
+
+# 先以 FOR UPDATE 锁住该用户的文件夹行，阻止并发的增量更新；
+# 加锁后再执行汇总语句，READ COMMITTED 下新语句的快照可以看到加锁前已提交的变更
+LOCK_USER_FOLDERS_SQL = text("""
+    SELECT id FROM cloudfiles WHERE user_id = :user_id AND is_folder = TRUE FOR UPDATE
+""")
+
+# 一次扫描该用户的所有文件，按 unnest(ancestors) 汇总，只更新与实际不一致的文件夹
+RECONCILE_USER_SQL = text("""
+    WITH stats AS (
+        SELECT a.folder_id, SUM(COALESCE(c.size, 0)) AS size, COUNT(*) AS file_count
+        FROM cloudfiles c CROSS JOIN LATERAL unnest(c.ancestors) AS a(folder_id)
+        WHERE c.user_id = :user_id AND c.is_folder = FALSE AND c.deleted_at IS NULL
+        GROUP BY a.folder_id
+    ), expected AS (
+        SELECT folder.id, COALESCE(stats.size, 0) AS size, COALESCE(stats.file_count, 0) AS file_count
+        FROM cloudfiles folder LEFT JOIN stats ON stats.folder_id = folder.id
+        WHERE folder.user_id = :user_id AND folder.is_folder = TRUE
+    )
+    UPDATE cloudfiles f
+    SET tree_size = expected.size, tree_file_count = expected.file_count
+    FROM expected
+    WHERE f.id = expected.id
+      AND (f.tree_size, f.tree_file_count) IS DISTINCT FROM (expected.size, expected.file_count)
+    RETURNING f.id
+""")
+
+
+# 返回 {user_id: 修正的文件夹数}
+def reconcile(user_ids=None):
+    if not user_ids:
+        user_ids = [row.user_id for row in db.session.execute(USERS_WITH_FOLDERS_SQL)]
+    fixed = {}
+    for user_id in user_ids:
+        try:
+            db.session.execute(LOCK_USER_FOLDERS_SQL, {'user_id': user_id})
+            count = len(db.session.execute(RECONCILE_USER_SQL, {'user_id': user_id}).all())
+            db.session.commit()
+        except Exception as e:
+            print(f"reconcile {user_id} failed: {e}")
+            db.session.rollback()
+            continue
+        if count:
+            fixed[user_id] = count
+            print(f"{user_id}: fixed {count} folders")
+    return fixed
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        reconcile(sys.argv[1:])
@@ -0,0 +1,75 @@
+# 存储配额对账：按 cloudfiles 重新统计每个用户的 upload_used / online_edit_used，修正 user_storage_quota 的偏差
+# 配额只在物理删除时扣除，因此回收站中的文件同样计入；文件夹不计入
+# 用法（在 cloudAndFiles 目录下）：
+#   python -m jobs.reconcile_quota            修正
+#   python -m jobs.reconcile_quota --dry-run  只输出偏差，不修改
+import sys
+from sqlalchemy import text
+from app import app
+from extensions import db
+from utils.quota import invalidate_quota_mirrors
+
+# 一次 GROUP BY user_id, online_editable 扫描 cloudfiles，与 user_storage_quota 比较，只保留有偏差的用户
+QUOTA_DRIFT_CTE = """
+    WITH grouped AS (
+        SELECT user_id, online_editable, SUM(COALESCE(size, 0)) AS used
+        FROM cloudfiles
+        WHERE is_folder = FALSE
+        GROUP BY user_id, online_editable
+    ), actual AS (
+        SELECT user_id,
+               COALESCE(SUM(used) FILTER (WHERE NOT online_editable), 0) AS upload_used,
+               COALESCE(SUM(used) FILTER (WHERE online_editable), 0) AS online_edit_used
+        FROM grouped
+        GROUP BY user_id
+    ), drift AS (
+        SELECT q.user_id,
+               q.upload_used AS recorded_upload_used,
+               COALESCE(a.upload_used, 0) AS actual_upload_used,
+               q.online_edit_used AS recorded_online_edit_used,
+               COALESCE(a.online_edit_used, 0) AS actual_online_edit_used
+        FROM user_storage_quota q
+        LEFT JOIN actual a ON a.user_id = q.user_id
+        WHERE (q.upload_used, q.online_edit_used)
+              IS DISTINCT FROM (COALESCE(a.upload_used, 0), COALESCE(a.online_edit_used, 0))
+    )
+"""
+
+QUOTA_DRIFT_SQL = text(QUOTA_DRIFT_CTE + """
+    SELECT * FROM drift ORDER BY user_id
+""")
+
+# 按差值修正而不是直接覆盖：统计快照之后并发提交的上传已计入当前行，差值不受影响，不会丢失并发更新
+RECONCILE_QUOTA_SQL = text(QUOTA_DRIFT_CTE + """
+    UPDATE user_storage_quota q
+    SET upload_used = q.upload_used + (drift.actual_upload_used - drift.recorded_upload_used),
+        online_edit_used = q.online_edit_used + (drift.actual_online_edit_used - drift.recorded_online_edit_used),
+        updated_at = NOW()
+    FROM drift
+    WHERE q.user_id = drift.user_id
+    RETURNING drift.*
+""")
+
+
+def _report(rows):
+    for row in rows:
+        print(f"{row.user_id}: upload_used {row.recorded_upload_used} -> {row.actual_upload_used}, "
+              f"online_edit_used {row.recorded_online_edit_used} -> {row.actual_online_edit_used}")
+    print(f"{len(rows)} users drifted")
+
+# 返回有偏差的行；dry_run 为 False 时在一条 UPDATE 中批量修正
+def reconcile(dry_run=False):
+    if dry_run:
+        rows = db.session.execute(QUOTA_DRIFT_SQL).all()
+        db.session.rollback()
+    else:
+        rows = db.session.execute(RECONCILE_QUOTA_SQL).all()
+        db.session.commit()
+        invalidate_quota_mirrors([row.user_id for row in rows])
+    _report(rows)
+    return rows
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        reconcile(dry_run='--dry-run' in sys.argv[1:])
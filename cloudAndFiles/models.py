@@ -1,7 +1,8 @@
 from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from extensions import db
 from datetime import datetime
-from decimal import Decimal
+from utils.content_codec import encode_content, decode_content
 
 
 class Cloudfiles(db.Model):
@@ -13,6 +14,11 @@ class Cloudfiles(db.Model):
         db.Index('idx_files_user_deleted', 'user_id', 'deleted_at'),
         db.Index('idx_files_user_id', 'user_id'),
         db.Index('uq_files_path_name', 'user_id', 'parent_id', 'name', unique=True),
+        db.Index('idx_files_ancestors', 'ancestors', postgresql_using='gin'),
+        db.Index('idx_files_list_name', 'user_id', 'parent_id', 'is_folder', 'name', 'id',
+                 postgresql_where=text('deleted_at IS NULL')),
+        db.Index('idx_files_list_updated', 'user_id', 'parent_id', 'is_folder', 'updated_at', 'id',
+                 postgresql_where=text('deleted_at IS NULL')),
         {'comment': '云盘文件表'}
     )
 
@@ -28,6 +34,10 @@ class Cloudfiles(db.Model):
     deleted_at = db.Column(db.DateTime, nullable=True)
     file_suffix = db.Column(db.Text, nullable=True)
     online_editable = db.Column(db.Boolean, nullable=False, server_default=text('false'))
+    ancestors = db.Column(ARRAY(db.Uuid), nullable=False, server_default=text("'{}'::uuid[]")) # 根目录->父文件夹的祖先ID链
+    tree_size = db.Column(db.BigInteger, nullable=False, server_default=text('0')) # 文件夹：子树中未删除文件的总大小
+    tree_file_count = db.Column(db.Integer, nullable=False, server_default=text('0')) # 文件夹：子树中未删除文件的数量
+    content_hash = db.Column(db.Text, nullable=True) # 上传文件：内容的 SHA-256，对应 file_blobs 中的对象，见 utils.file_blobs
 
     def to_dict(self):
         return {
@@ -42,9 +52,26 @@ class Cloudfiles(db.Model):
             'updated_at': self.updated_at,
             'deleted_at': self.deleted_at,
             'file_suffix': self.file_suffix,
-            'online_editable': self.online_editable
+            'online_editable': self.online_editable,
+            'tree_size': self.tree_size,
+            'tree_file_count': self.tree_file_count
         }
 
+# 文件列表按大小排序用的表达式索引（文件夹 size 为 NULL，按 0 排序）
+db.Index('idx_files_list_size', Cloudfiles.user_id, Cloudfiles.parent_id, Cloudfiles.is_folder,
+         db.func.coalesce(Cloudfiles.size, 0), Cloudfiles.id,
+         postgresql_where=Cloudfiles.deleted_at.is_(None))
+
+# 文件名模糊搜索用的trigram索引（需 pg_trgm、btree_gin 扩展），只包含未删除的行
+db.Index('idx_files_name_trgm', Cloudfiles.user_id, Cloudfiles.name,
+         postgresql_using='gin',
+         postgresql_ops={'name': 'gin_trgm_ops'},
+         postgresql_where=Cloudfiles.deleted_at.is_(None))
+
+# 回收站keyset分页用的部分索引，只包含已逻辑删除的行
+db.Index('idx_files_user_trash', Cloudfiles.user_id, Cloudfiles.deleted_at.desc(), Cloudfiles.id.desc(),
+         postgresql_where=Cloudfiles.deleted_at.isnot(None))
+
 class Filecontent(db.Model):
     __tablename__ = 'filecontent'
     __table_args__ = (
@@ -52,7 +79,8 @@ class Filecontent(db.Model):
         db.Index('idx_filecontent_deleted_at', 'deleted_at'),
         db.Index('idx_filecontent_file_suffix', 'file_suffix'),
         db.Index('idx_filecontent_id', 'id'),
-        db.Index('idx_filecontent_user_id', 'user_id')
+        db.Index('idx_filecontent_user_id', 'user_id'),
+        db.Index('idx_filecontent_search_vector', 'search_vector', postgresql_using='gin')
     )
 
     id = db.Column(db.Uuid, primary_key=True)
@@ -63,20 +91,50 @@ class Filecontent(db.Model):
     updated_at = db.Column(db.DateTime, server_default=text('now()'))
     created_at = db.Column(db.DateTime, server_default=text('now()'))
     deleted_at = db.Column(db.DateTime)
+    search_vector = db.Column(TSVECTOR, deferred=True) # 全文检索用，由 utils.text_search.build_search_vector 生成
+    content_codec = db.Column(db.Text) # 内容的存储方式，NULL 为未压缩，见 utils.content_codec
+    content_blob = db.Column(db.LargeBinary) # 压缩后的内容
+    content_size = db.Column(db.BigInteger) # 内容的 UTF-8 字节数，由 set_content 维护
+    version = db.Column(db.Integer, nullable=False, server_default=text('1')) # 内容的版本号，每次保存递增，历史版本见 FilecontentRevisions
+
+    # 读写内容统一经过这两个方法，不直接访问 content
+    def get_content(self):
+        return decode_content(self.content_codec, self.content, self.content_blob)
+
+    def set_content(self, content):
+        self.content_codec, self.content, self.content_blob, self.content_size = encode_content(content)
 
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
             'name': self.name,
-            'content': self.content,
+            'content': self.get_content(),
             'file_suffix': self.file_suffix,
             'updated_at': self.updated_at,
             'created_at': self.created_at,
-            'deleted_at': self.deleted_at
+            'deleted_at': self.deleted_at,
+            'version': self.version
         }
 
 
+class FilecontentRevisions(db.Model):
+    __tablename__ = 'filecontent_revisions'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('file_id', 'revision', name='filecontent_revisions_pkey'),
+        db.Index('idx_filecontent_revisions_saved_at', 'saved_at')
+    )
+
+    file_id = db.Column(db.Uuid, db.ForeignKey('filecontent.id', ondelete='CASCADE'), primary_key=True)
+    revision = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Text)
+    kind = db.Column(db.Text, nullable=False) # full：完整内容，delta：相对下一个更新版本的反向增量，见 utils.revisions
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False) # 该版本内容的 UTF-8 字节数
+    saved_at = db.Column(db.DateTime) # 该版本内容的保存时间
+    created_at = db.Column(db.DateTime, server_default=text('now()'))
+
+
 class Users(db.Model):
     __tablename__ = 'users'
     __table_args__ = (
@@ -107,55 +165,58 @@ class UserStorageQuota(db.Model):
     )
 
     user_id = db.Column(db.Text, primary_key=True)
-    online_edit_limit = db.Column(db.Text, server_default=text("'134217728'::text"))
-    upload_limit = db.Column(db.Text, server_default=text("'1073741824'::text"))
-    online_edit_used = db.Column(db.Text, server_default=text("'0'::text"))
-    upload_used = db.Column(db.Text, server_default=text("'0'::text"))
+    online_edit_limit = db.Column(db.BigInteger, nullable=False, server_default=text('134217728'))
+    upload_limit = db.Column(db.BigInteger, nullable=False, server_default=text('1073741824'))
+    online_edit_used = db.Column(db.BigInteger, nullable=False, server_default=text('0'))
+    upload_used = db.Column(db.BigInteger, nullable=False, server_default=text('0'))
     created_at = db.Column(db.DateTime, server_default=text('now()'))
     updated_at = db.Column(db.DateTime, server_default=text('now()'))
 
     def update_limits(self, online_edit_limit=None, upload_limit=None):
         if online_edit_limit is not None:
-            self.online_edit_limit = str(Decimal(online_edit_limit))
+            self.online_edit_limit = int(online_edit_limit)
         if upload_limit is not None:
-            self.upload_limit = str(Decimal(upload_limit))
+            self.upload_limit = int(upload_limit)
         self.updated_at = datetime.now()
         return True
 
-    def increase_online_edit_used(self, amount): # 内存不足则返回False
-        new_value = Decimal(self.online_edit_used) + Decimal(amount)
-        if new_value > Decimal(self.online_edit_limit):
-            return False
-        self.online_edit_used = str(new_value)
-        self.updated_at = datetime.now()
-        return True
+    # 配额的增减均为一条带条件的 UPDATE ... RETURNING，在数据库中原子地完成检查与累加，
+    # 无需先 SELECT 再在 Python 中计算，并发上传时不会丢失更新；不提交事务，由调用方 commit/rollback
+    @classmethod
+    def _update_used(cls, user_id, column, limit_column, amount, check_limit):
+        stmt = db.update(cls).where(cls.user_id == user_id)
+        if check_limit:
+            stmt = stmt.where(column + amount <= limit_column)
+        stmt = stmt.values({
+            column: db.func.greatest(column + amount, 0),
+            cls.updated_at: db.func.now()
+        }).returning(column).execution_options(synchronize_session=False)
+        return db.session.execute(stmt).first() is not None
 
-    def decrease_online_edit_used(self, amount):
-        self.online_edit_used = str(max(Decimal(self.online_edit_used) - Decimal(amount), Decimal('0')))
-        self.updated_at = datetime.now()
-        return True
+    @classmethod
+    def increase_online_edit_used(cls, user_id, amount): # 内存不足则返回False
+        return cls._update_used(user_id, cls.online_edit_used, cls.online_edit_limit, int(amount), True)
 
-    def replace_online_upload_used(self, old_value, new_value): # 内存不足则返回False
-        current = Decimal(self.online_edit_used)
-        updated = current - Decimal(old_value) + Decimal(new_value)
-        if updated > Decimal(self.online_edit_limit):
-            return False
-        self.online_edit_used = str(max(updated, Decimal('0')))
-        self.updated_at = datetime.now()
-        return True
+    @classmethod
+    def decrease_online_edit_used(cls, user_id, amount):
+        return cls._update_used(user_id, cls.online_edit_used, cls.online_edit_limit, -int(amount), False)
 
-    def increase_upload_used(self, amount): # 内存不足则返回False
-        new_value = Decimal(self.upload_used) + Decimal(amount)
-        if new_value > Decimal(self.upload_limit):
-            return False
-        self.upload_used = str(new_value)
-        self.updated_at = datetime.now()
-        return True
+    @classmethod
+    def replace_online_upload_used(cls, user_id, old_value, new_value): # 内存不足则返回False，文件变小时不检查上限
+        delta = int(new_value or 0) - int(old_value or 0)
+        return cls._update_used(user_id, cls.online_edit_used, cls.online_edit_limit, delta, delta > 0)
 
-    def decrease_upload_used(self, amount):
-        self.upload_used = str(max(Decimal(self.upload_used) - Decimal(amount), Decimal('0')))
-        self.updated_at = datetime.now()
-        return True
+    @classmethod
+    def adjust_online_edit_used(cls, user_id, delta): # 不检查上限，写缓冲刷写时使用（写入缓冲区时已检查配额）
+        return cls._update_used(user_id, cls.online_edit_used, cls.online_edit_limit, int(delta), False)
+
+    @classmethod
+    def increase_upload_used(cls, user_id, amount): # 内存不足则返回False
+        return cls._update_used(user_id, cls.upload_used, cls.upload_limit, int(amount), True)
+
+    @classmethod
+    def decrease_upload_used(cls, user_id, amount):
+        return cls._update_used(user_id, cls.upload_used, cls.upload_limit, -int(amount), False)
 
     def to_dict(self):
         return {
@@ -183,3 +244,17 @@ class SystemConfig(db.Model):
     def update_value(self, new_value):
         self.config_value = str(new_value)
         self.updated_at = datetime.now()
+
+class FileBlobs(db.Model):
+    __tablename__ = 'file_blobs'
+    __table_args__ = (
+        db.PrimaryKeyConstraint('user_id', 'content_hash', name='file_blobs_pkey'),
+    )
+
+    user_id = db.Column(db.Text, primary_key=True)
+    content_hash = db.Column(db.Text, primary_key=True) # 内容的 SHA-256 十六进制串
+    oss_path = db.Column(db.Text, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, server_default=text('0')) # 引用该对象的 cloudfiles 行数（含回收站中的文件）
+    created_at = db.Column(db.DateTime, server_default=text('now()'))
+    updated_at = db.Column(db.DateTime, server_default=text('now()'))
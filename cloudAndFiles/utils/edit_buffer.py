@@ -0,0 +1,278 @@
+import time
+from datetime import datetime
+from sqlalchemy import text
+from extensions import db, redis_client
+from models import Cloudfiles, Filecontent, UserStorageQuota
+from utils.text_patch import content_hash
+from utils.text_search import build_search_vector
+from utils.revisions import record_revision
+from utils.file_tree import adjust_folder_stats
+from utils.recent_files import recent_files_upsert
+from utils.utils import invalidate_file_list_cache
+
+# 在线编辑的写缓冲（write-behind）
+# 保存只写入 Redis 中的文档缓冲区，由 jobs.flush_edit_buffers 定期（或编辑器关闭时）合并写入数据库，
+# 连续的自动保存在一个刷写周期内只产生一次 cloudfiles / filecontent / user_storage_quota 的写入
+#   edit-buf:{file_id}         哈希，文档缓冲区：
+#                                user_id / content / hash / size       最新内容及其哈希、UTF-8 字节数
+#                                version                               每次保存递增，初始为数据库中的 version
+#                                flushed_version                       已写入数据库的版本，与 version 相同时缓冲区是干净的
+#                                db_size                               数据库中 cloudfiles.size（已计入配额的大小）
+#                                saved_at                              最后一次保存的时间，刷写时写入 updated_at
+#   edit-buf-dirty             有序集合，有未刷写保存的文档，score 为首次未刷写保存的时间戳
+#   edit-buf-user:{user_id}    哈希，该用户未刷写的文档 -> 缓冲内容相对 db_size 的大小变化（配额检查用）
+# 数据库中的内容只由刷写修改：刷写先锁定内容行再读缓冲区，并发的刷写依次进行；
+# 刷写后数据库的 version 取缓冲区的 version，读取时缓冲区的版本总是不低于数据库；
+# 未开启写缓冲时的保存直接写数据库并删除缓冲区，删除失败留下的旧缓冲区（版本低于数据库）不再使用。
+# 有未刷写内容的缓冲区不设过期时间（Redis 需开启持久化，且不能配置为逐出这些 key），干净的缓冲区保留 EDIT_BUFFER_EX 秒，
+# 期间的增量保存仍可直接在缓冲区上应用。
+# 配额在写入缓冲区时检查：数据库中的 online_edit_used + 该用户其他文档未刷写的大小变化 + 本次大小变化 <= 上限，
+# 刷写时按已检查过的变化量直接累加，不再检查上限；新建文件等其他途径仍只按数据库检查，
+# 与未刷写的增长并发时最多超出这部分增长，之后使文件变大的保存会被拒绝
+EDIT_BUFFER_EX = 3600
+EDIT_BUFFER_FLUSH_INTERVAL = 30
+EDIT_BUFFER_DIRTY_KEY = "edit-buf-dirty"
+
+# 保存结果
+EDIT_BUFFER_QUOTA_EXCEEDED = 0
+EDIT_BUFFER_MISSING = -1
+EDIT_BUFFER_CONFLICT = -2
+
+INIT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'user_id', ARGV[1], 'content', ARGV[2], 'hash', ARGV[3], 'size', ARGV[4],
+    'version', ARGV[5], 'flushed_version', ARGV[5], 'db_size', ARGV[4], 'saved_at', ARGV[6])
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+return 1
+"""
+
+# 哈希校验（增量保存）、配额检查与写入在 Lua 中原子完成；返回 {新版本号} 或 {错误码[, 当前哈希]}
+SAVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1}
+end
+if ARGV[2] ~= '' then
+    local current_hash = redis.call('HGET', KEYS[1], 'hash')
+    if current_hash ~= ARGV[2] then
+        return {-2, current_hash}
+    end
+end
+local size = tonumber(ARGV[5])
+local delta = size - tonumber(redis.call('HGET', KEYS[1], 'db_size'))
+if size > tonumber(redis.call('HGET', KEYS[1], 'size')) then
+    local pending = 0
+    local entries = redis.call('HGETALL', KEYS[3])
+    for i = 1, #entries, 2 do
+        if entries[i] ~= ARGV[1] then
+            pending = pending + tonumber(entries[i + 1])
+        end
+    end
+    if tonumber(ARGV[8]) + pending + delta > tonumber(ARGV[9]) then
+        return {0}
+    end
+end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSET', KEYS[1], 'content', ARGV[3], 'hash', ARGV[4], 'size', ARGV[5], 'saved_at', ARGV[6])
+redis.call('PERSIST', KEYS[1])
+redis.call('HSET', KEYS[3], ARGV[1], delta)
+redis.call('ZADD', KEYS[2], 'NX', ARGV[7], ARGV[1])
+return {version}
+"""
+
+# 刷写提交后调用：刷写期间没有新的保存时缓冲区变为干净的，否则按剩余的大小变化继续等待下一次刷写
+FLUSHED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 0
+end
+redis.call('HSET', KEYS[1], 'flushed_version', ARGV[2], 'db_size', ARGV[3])
+if redis.call('HGET', KEYS[1], 'version') == ARGV[2] then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+redis.call('HSET', KEYS[3], ARGV[1], tonumber(redis.call('HGET', KEYS[1], 'size')) - tonumber(ARGV[3]))
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+return 2
+"""
+
+# 缓冲区已不存在时移出待刷写队列
+FORGET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return redis.call('ZREM', KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+# 删除版本低于数据库的干净缓冲区；有未刷写的保存时保留
+DISCARD_STALE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'version', 'flushed_version')
+if state[1] and state[1] == state[2] and tonumber(state[1]) < tonumber(ARGV[1]) then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 保存时的数据库读取（均为主键查询，不写入）：确认文件属于该用户，并取得返回所需的元信息与配额
+SAVE_CONTEXT_SQL = text("""
+    SELECT f.name, f.version, c.parent_id, q.online_edit_used, q.online_edit_limit
+    FROM filecontent f
+    JOIN cloudfiles c ON c.id = f.id
+    JOIN user_storage_quota q ON q.user_id = f.user_id
+    WHERE f.id = :file_id AND f.user_id = :user_id
+""")
+
+BUFFER_FIELDS = ('user_id', 'hash', 'size', 'version', 'flushed_version', 'db_size', 'saved_at')
+
+
+def _buffer_key(file_id):
+    return f"edit-buf:{file_id}"
+
+
+def _user_key(user_id):
+    return f"edit-buf-user:{user_id}"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+# 读取缓冲区，不存在时返回 None；with_content 为 False 时不取内容
+# Redis 异常时向上抛出：缓冲区中可能有比数据库更新的内容，不能退回读数据库
+def get_edit_buffer(file_id, with_content=False):
+    fields = BUFFER_FIELDS + (('content',) if with_content else ())
+    values = redis_client.hmget(_buffer_key(file_id), fields)
+    if values[0] is None:
+        return None
+    state = {field: _decode(value) for field, value in zip(fields, values)}
+    for field in ('size', 'version', 'flushed_version', 'db_size'):
+        state[field] = int(state[field])
+    state['saved_at'] = datetime.fromisoformat(state['saved_at'])
+    return state
+
+# 缓冲区的版本号，不存在时返回 None（用于生成 ETag，不取内容）
+def get_edit_buffer_version(file_id):
+    version = redis_client.hget(_buffer_key(file_id), 'version')
+    return int(version) if version is not None else None
+
+# 删除版本低于 db_version 的干净缓冲区（直接写数据库的保存之后留下的），删除了返回 True
+def discard_stale_edit_buffer(file_id, db_version):
+    return bool(redis_client.eval(DISCARD_STALE_SCRIPT, 1, _buffer_key(file_id), db_version))
+
+# 返回保存所需的数据库信息（name, version, parent_id, online_edit_used, online_edit_limit），文件不存在时返回 None
+def get_save_context(user_id, file_id):
+    return db.session.execute(SAVE_CONTEXT_SQL, {'file_id': file_id, 'user_id': user_id}).first()
+
+# 以数据库中的内容建立缓冲区（已存在时保留现有的），返回缓冲区；文件不存在时返回 None
+def init_edit_buffer(user_id, file_id):
+    file_content = Filecontent.query.filter_by(id=file_id, user_id=user_id).first()
+    db_size = db.session.query(Cloudfiles.size).filter_by(id=file_id, user_id=user_id).scalar()
+    if file_content is None:
+        return None
+    content = file_content.get_content() or ''
+    redis_client.eval(
+        INIT_SCRIPT, 1, _buffer_key(file_id),
+        user_id, content, content_hash(content), int(db_size or 0), file_content.version,
+        (file_content.updated_at or datetime.now()).isoformat(), EDIT_BUFFER_EX
+    )
+    return get_edit_buffer(file_id, with_content=True)
+
+# 写入缓冲区，返回 (结果, 值)：
+#   (新版本号, saved_at)                   成功
+#   (EDIT_BUFFER_CONFLICT, 当前哈希)       expected_hash 与缓冲区内容不一致
+#   (EDIT_BUFFER_QUOTA_EXCEEDED, None)     配额不足
+#   (EDIT_BUFFER_MISSING, None)            缓冲区已过期，调用方重新建立后重试
+def save_edit_buffer(user_id, file_id, content, size, context, expected_hash=None):
+    saved_at = datetime.now()
+    result = redis_client.eval(
+        SAVE_SCRIPT, 3, _buffer_key(file_id), EDIT_BUFFER_DIRTY_KEY, _user_key(user_id),
+        str(file_id), expected_hash or '', content, content_hash(content), int(size), saved_at.isoformat(),
+        time.time(), context.online_edit_used, context.online_edit_limit
+    )
+    code = int(result[0])
+    if code > 0:
+        return code, saved_at
+    return code, _decode(result[1]) if len(result) > 1 else None
+
+# 丢弃缓冲区（文件被物理删除后调用），不写入数据库
+def discard_edit_buffers(user_id, file_ids):
+    if not file_ids:
+        return
+    members = [str(file_id) for file_id in file_ids]
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(*[_buffer_key(file_id) for file_id in members])
+        pipe.zrem(EDIT_BUFFER_DIRTY_KEY, *members)
+        pipe.hdel(_user_key(user_id), *members)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis delete error: {e}")
+
+
+def _mark_flushed(user_id, file_id, version, size):
+    redis_client.eval(
+        FLUSHED_SCRIPT, 3, _buffer_key(file_id), EDIT_BUFFER_DIRTY_KEY, _user_key(user_id),
+        str(file_id), version, int(size or 0), time.time(), EDIT_BUFFER_EX
+    )
+
+# 缓冲区有未刷写的保存时返回 True；否则确保其不在待刷写队列中（检查与移出在 Lua 中原子完成，不会移出并发的新保存）
+def _is_dirty(state, file_id):
+    if state is None:
+        redis_client.eval(FORGET_SCRIPT, 2, _buffer_key(file_id), EDIT_BUFFER_DIRTY_KEY, str(file_id))
+        return False
+    if state['version'] == state['flushed_version']:
+        _mark_flushed(state['user_id'], file_id, state['flushed_version'], state['db_size'])
+        return False
+    return True
+
+# 把缓冲区中未刷写的内容写入数据库（提交事务），写入了返回 True；没有缓冲区或缓冲区是干净的返回 False
+def flush_edit_buffer(file_id):
+    # 先不加锁检查一次，缓冲区干净时（下载、查看历史版本时多数如此）不锁定内容行
+    if not _is_dirty(get_edit_buffer(file_id), file_id):
+        return False
+    # 锁定内容行后重新读取缓冲区
+    file_content = Filecontent.query.filter_by(id=file_id).with_for_update().first()
+    state = get_edit_buffer(file_id, with_content=True)
+    if not _is_dirty(state, file_id):
+        db.session.rollback()
+        return False
+    user_id = state['user_id']
+    cloud_file = Cloudfiles.query.filter_by(id=file_id, user_id=user_id).first()
+    if file_content is None or cloud_file is None:
+        db.session.rollback()
+        discard_edit_buffers(user_id, [file_id])
+        return False
+    if file_content.version >= state['version']:
+        # 上次刷写已提交、但未及更新缓冲区
+        db.session.rollback()
+        _mark_flushed(user_id, file_id, state['version'], cloud_file.size)
+        return False
+    content = state['content']
+    size = state['size']
+    delta = size - (cloud_file.size or 0)
+    UserStorageQuota.adjust_online_edit_used(user_id, delta)
+    if cloud_file.deleted_at is None:
+        adjust_folder_stats(user_id, cloud_file.ancestors, delta)
+    # 被覆盖的内容记为历史版本，需在更新 updated_at 之前调用
+    record_revision(file_content, file_content.get_content(), content)
+    cloud_file.updated_at = state['saved_at']
+    cloud_file.size = size
+    file_content.updated_at = state['saved_at']
+    file_content.set_content(content)
+    file_content.search_vector = build_search_vector(content)
+    file_content.version = max(file_content.version, state['version'])
+    db.session.add_all([cloud_file, file_content])
+    db.session.commit()
+    _mark_flushed(user_id, file_id, state['version'], size)
+    if cloud_file.deleted_at is None:
+        recent_files_upsert(user_id, [cloud_file])
+    invalidate_file_list_cache(user_id, [None, *cloud_file.ancestors])
+    return True
+
+# 首次未刷写的保存早于 interval 秒的文档ID，最多 limit 个
+def get_due_edit_buffers(interval=EDIT_BUFFER_FLUSH_INTERVAL, limit=100):
+    file_ids = redis_client.zrangebyscore(EDIT_BUFFER_DIRTY_KEY, '-inf', time.time() - interval, start=0, num=limit)
+    return [_decode(file_id) for file_id in file_ids]
@@ -0,0 +1,70 @@
+from sqlalchemy import text
+from extensions import db
+
+# 上传文件的内容寻址存储（秒传）
+# file_blobs 以 (user_id, content_hash) 记录一个OSS对象及引用它的 cloudfiles 行数：
+#   - 前端上传前先提交文件的 SHA-256，已有相同内容与大小的对象时直接新建 cloudfiles 行指向它，无需上传
+#   - 正常上传完成后登记对象；并发上传了相同内容时以先登记的对象为准，后上传的对象放入删除队列
+#   - 物理删除时引用数减一，减到0才删除OSS对象
+# 只在同一用户内去重：跨用户去重时，知道某个文件哈希的人即可凭哈希“秒传”得到该文件
+# 逻辑删除（回收站）的文件仍计入引用数；未登记哈希的旧文件与ZIP导入的文件 content_hash 为 NULL，照常删除对象
+
+# 引用已有对象，返回其OSS路径；不存在或大小不一致时返回 None
+ACQUIRE_BLOB_SQL = text("""
+    UPDATE file_blobs
+    SET ref_count = ref_count + 1, updated_at = NOW()
+    WHERE user_id = :user_id AND content_hash = :content_hash AND size = :size
+    RETURNING oss_path
+""")
+
+# 登记新上传的对象；已登记相同哈希时改为引用已有对象，大小不一致时不登记（返回空）
+REGISTER_BLOB_SQL = text("""
+    INSERT INTO file_blobs (user_id, content_hash, oss_path, size, ref_count)
+    VALUES (:user_id, :content_hash, :oss_path, :size, 1)
+    ON CONFLICT (user_id, content_hash) DO UPDATE
+    SET ref_count = file_blobs.ref_count + 1, updated_at = NOW()
+    WHERE file_blobs.size = EXCLUDED.size
+    RETURNING oss_path
+""")
+
+# 按哈希分组扣减引用数
+RELEASE_BLOBS_SQL = text("""
+    UPDATE file_blobs b
+    SET ref_count = b.ref_count - r.released, updated_at = NOW()
+    FROM (
+        SELECT h AS content_hash, COUNT(*) AS released
+        FROM unnest(CAST(:content_hashes AS text[])) AS h
+        GROUP BY h
+    ) r
+    WHERE b.user_id = :user_id AND b.content_hash = r.content_hash
+""")
+
+# 删除不再被引用的对象记录，返回其OSS路径
+DELETE_UNREFERENCED_BLOBS_SQL = text("""
+    DELETE FROM file_blobs
+    WHERE user_id = :user_id AND content_hash = ANY(CAST(:content_hashes AS text[])) AND ref_count <= 0
+    RETURNING oss_path
+""")
+
+# 以下函数均不提交事务，由调用方 commit/rollback
+
+def acquire_blob(user_id, content_hash, size):
+    row = db.session.execute(ACQUIRE_BLOB_SQL, {
+        'user_id': user_id, 'content_hash': content_hash, 'size': size
+    }).first()
+    return row.oss_path if row else None
+
+# 返回 cloudfiles 应指向的OSS路径：新登记时为 oss_path，已有相同内容时为已有对象的路径，大小不一致时为 None
+def register_blob(user_id, content_hash, oss_path, size):
+    row = db.session.execute(REGISTER_BLOB_SQL, {
+        'user_id': user_id, 'content_hash': content_hash, 'oss_path': oss_path, 'size': size
+    }).first()
+    return row.oss_path if row else None
+
+# content_hashes 为被物理删除的文件的哈希（可重复，每个文件一项），返回引用数归零、需要从OSS删除的对象路径
+def release_blobs(user_id, content_hashes):
+    if not content_hashes:
+        return []
+    params = {'user_id': user_id, 'content_hashes': list(content_hashes)}
+    db.session.execute(RELEASE_BLOBS_SQL, params)
+    return [row.oss_path for row in db.session.execute(DELETE_UNREFERENCED_BLOBS_SQL, params)]
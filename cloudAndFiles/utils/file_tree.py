@@ -0,0 +1,233 @@
+import uuid
+from sqlalchemy import text
+from extensions import db
+from models import Cloudfiles
+from utils.file_blobs import release_blobs
+
+# 文件树相关的集合操作
+# cloudfiles.ancestors 存储根目录->父文件夹的祖先ID链（不含自身），配合GIN索引：
+#   X的子树（含X自身）：id = X OR ancestors @> ARRAY[X]
+#   X是否为Y的祖先：X = ANY(Y.ancestors)
+SUBTREE_CONDITION = "(id = CAST(:root_id AS uuid) OR ancestors @> ARRAY[CAST(:root_id AS uuid)])"
+
+# ORM 查询中使用的子孙过滤条件（不含 root_id 自身）
+def descendants_filter(root_id):
+    return text("cloudfiles.ancestors @> ARRAY[CAST(:descendants_root_id AS uuid)]").bindparams(
+        descendants_root_id=str(root_id)
+    )
+
+# 文件夹聚合统计：tree_size / tree_file_count 为文件夹子树中未删除文件的总大小与文件数
+# 不论文件夹自身是否被删除，只统计 deleted_at IS NULL 的文件，因此：
+#   - 文件的存活状态或大小变化时，对其所有祖先文件夹加减一次即可，子树内部的统计无需重算
+#   - 批量变化时按 unnest(ancestors) 分组，一条UPDATE更新所有受影响的文件夹
+# file_condition 为选出变化文件的条件（以 c 为别名的 cloudfiles 行）
+TREE_STATS_DELTA_SQL = """
+    UPDATE cloudfiles f
+    SET tree_size = f.tree_size + :sign * d.size,
+        tree_file_count = f.tree_file_count + :sign * d.file_count
+    FROM (
+        SELECT a.folder_id, SUM(COALESCE(c.size, 0)) AS size, COUNT(*) AS file_count
+        FROM cloudfiles c CROSS JOIN LATERAL unnest(c.ancestors) AS a(folder_id)
+        WHERE c.user_id = :user_id AND c.is_folder = FALSE AND {file_condition}
+        GROUP BY a.folder_id
+    ) d
+    WHERE f.id = d.folder_id AND f.user_id = :user_id
+"""
+
+# root_id 子树中未删除的文件
+SUBTREE_LIVE_FILES_STATS_SQL = text(TREE_STATS_DELTA_SQL.format(
+    file_condition="c.deleted_at IS NULL AND (c.id = CAST(:root_id AS uuid) OR c.ancestors @> ARRAY[CAST(:root_id AS uuid)])"
+))
+
+# 指定ID的文件
+FILES_STATS_SQL = text(TREE_STATS_DELTA_SQL.format(
+    file_condition="c.id = ANY(CAST(:file_ids AS uuid[]))"
+))
+
+ADJUST_FOLDER_STATS_SQL = text("""
+    UPDATE cloudfiles
+    SET tree_size = tree_size + :size_delta, tree_file_count = tree_file_count + :count_delta
+    WHERE user_id = :user_id AND id = ANY(CAST(:folder_ids AS uuid[]))
+""")
+
+# 单个文件的新增、删除或大小变化：对祖先链上的文件夹直接加减
+def adjust_folder_stats(user_id, ancestors, size_delta, count_delta=0):
+    if not ancestors or (not size_delta and not count_delta):
+        return
+    db.session.execute(ADJUST_FOLDER_STATS_SQL, {
+        'user_id': user_id,
+        'folder_ids': [str(a) for a in ancestors],
+        'size_delta': size_delta or 0,
+        'count_delta': count_delta
+    })
+
+# root_id 子树中未删除的文件计入（sign=1）或移出（sign=-1）其祖先文件夹的统计
+# 逻辑删除、物理删除、移动前以 -1 调用，移动后以 1 调用
+def apply_subtree_stats(user_id, root_id, sign):
+    db.session.execute(SUBTREE_LIVE_FILES_STATS_SQL, {'user_id': user_id, 'root_id': str(root_id), 'sign': sign})
+
+# 指定的文件计入（sign=1）或移出（sign=-1）其祖先文件夹的统计，用于恢复
+def apply_files_stats(user_id, file_ids, sign):
+    if not file_ids:
+        return
+    db.session.execute(FILES_STATS_SQL, {'user_id': user_id, 'file_ids': [str(i) for i in file_ids], 'sign': sign})
+
+# 子树整体移动：把旧的祖先前缀替换为新的祖先前缀，节点自身与所有子孙一条UPDATE完成
+MOVE_SUBTREE_SQL = text(f"""
+    UPDATE cloudfiles
+    SET ancestors = CAST(:new_prefix AS uuid[]) || ancestors[:old_prefix_len + 1:]
+    WHERE user_id = :user_id AND {SUBTREE_CONDITION}
+""")
+
+
+def _to_uuid(value):
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+# 获取新建于 parent_id 下的子节点的祖先链
+# parent_id 为空（根目录）返回空列表；父文件夹不存在、已删除或不是文件夹时返回 None
+def get_child_ancestors(user_id, parent_id):
+    if not parent_id:
+        return []
+    parent = db.session.query(Cloudfiles.id, Cloudfiles.ancestors).filter_by(
+        id=parent_id,
+        user_id=user_id,
+        is_folder=True,
+        deleted_at=None
+    ).first()
+    if parent is None:
+        return None
+    return [_to_uuid(a) for a in (parent.ancestors or [])] + [_to_uuid(parent.id)]
+
+# 判断 ancestor_id 是否为 node（Cloudfiles 或含 ancestors 的行）的祖先
+def is_ancestor(ancestor_id, node):
+    return _to_uuid(ancestor_id) in [_to_uuid(a) for a in (node.ancestors or [])]
+
+# 将 node_id 的子树挂到新的祖先链下，返回受影响的行数（节点自身 + 子孙）
+# 子树中未删除的文件先移出旧祖先文件夹的统计，移动后再计入新祖先文件夹
+def move_subtree(user_id, node_id, old_ancestors, new_ancestors):
+    apply_subtree_stats(user_id, node_id, -1)
+    result = db.session.execute(MOVE_SUBTREE_SQL, {
+        'user_id': user_id,
+        'root_id': str(node_id),
+        'new_prefix': [str(a) for a in new_ancestors],
+        'old_prefix_len': len(old_ancestors or [])
+    })
+    apply_subtree_stats(user_id, node_id, 1)
+    return result.rowcount
+
+# 逻辑删除子树：cloudfiles 与 filecontent 各一条UPDATE
+LOGICAL_DELETE_FILES_SQL = text(f"""
+    UPDATE cloudfiles SET deleted_at = :now
+    WHERE user_id = :user_id AND {SUBTREE_CONDITION}
+""")
+
+LOGICAL_DELETE_CONTENTS_SQL = text(f"""
+    UPDATE filecontent SET deleted_at = :now
+    WHERE user_id = :user_id AND id IN (
+        SELECT id FROM cloudfiles
+        WHERE user_id = :user_id AND {SUBTREE_CONDITION}
+          AND is_folder = FALSE AND online_editable = TRUE
+    )
+""")
+
+# 逻辑删除 root_id 及其所有子孙（设置 deleted_at），返回 cloudfiles 受影响的行数
+# 不提交事务，由调用方 commit/rollback
+def logical_delete_subtree(user_id, root_id, now):
+    params = {'user_id': user_id, 'root_id': str(root_id), 'now': now}
+    apply_subtree_stats(user_id, root_id, -1)
+    db.session.execute(LOGICAL_DELETE_CONTENTS_SQL, params)
+    return db.session.execute(LOGICAL_DELETE_FILES_SQL, params).rowcount
+
+# 物理删除子树：先删 filecontent，再删 cloudfiles 并取回被删文件的大小与OSS路径
+HARD_DELETE_CONTENTS_SQL = text(f"""
+    DELETE FROM filecontent
+    WHERE user_id = :user_id AND id IN (
+        SELECT id FROM cloudfiles
+        WHERE user_id = :user_id AND {SUBTREE_CONDITION}
+          AND is_folder = FALSE AND online_editable = TRUE
+    )
+""")
+
+HARD_DELETE_FILES_SQL = text(f"""
+    DELETE FROM cloudfiles
+    WHERE user_id = :user_id AND {SUBTREE_CONDITION}
+    RETURNING id, is_folder, online_editable, oss_path, size, content_hash
+""")
+
+# 物理删除 root_id 及其所有子孙，返回字典
+#   deleted_count：cloudfiles 删除的行数
+#   upload_size / online_edit_size：需要从配额中扣除的上传文件/在线编辑文件总大小
+#   oss_paths：需要从OSS删除的对象路径（登记了哈希的文件在 file_blobs 引用数归零时才删除）
+#   online_edit_ids：被删除的在线编辑文件ID（提交后丢弃其写缓冲）
+# 不提交事务，由调用方 commit/rollback；OSS对象需在提交后再删除
+def hard_delete_subtree(user_id, root_id):
+    params = {'user_id': user_id, 'root_id': str(root_id)}
+    apply_subtree_stats(user_id, root_id, -1)
+    db.session.execute(HARD_DELETE_CONTENTS_SQL, params)
+    rows = db.session.execute(HARD_DELETE_FILES_SQL, params).all()
+    result = {'deleted_count': len(rows), 'upload_size': 0, 'online_edit_size': 0, 'oss_paths': [], 'online_edit_ids': []}
+    content_hashes = []
+    for row in rows:
+        if row.is_folder:
+            continue
+        if row.online_editable:
+            result['online_edit_size'] += row.size or 0
+            result['online_edit_ids'].append(row.id)
+        else:
+            result['upload_size'] += row.size or 0
+            if row.content_hash:
+                content_hashes.append(row.content_hash)
+            elif row.oss_path:
+                result['oss_paths'].append(row.oss_path)
+    result['oss_paths'].extend(release_blobs(user_id, content_hashes))
+    return result
+
+# 恢复范围：root_id 的子树 + 已被删除的祖先文件夹（ancestor_ids 取自 root 的 ancestors）
+RESTORE_SCOPE_CONDITION = f"""
+    user_id = :user_id AND deleted_at IS NOT NULL
+    AND ({SUBTREE_CONDITION} OR id = ANY(CAST(:ancestor_ids AS uuid[])))
+"""
+
+# 恢复前的同名冲突检查：待恢复的节点在同一父目录下已存在未删除的同名文件/文件夹
+RESTORE_CONFLICT_SQL = text(f"""
+    WITH restoring AS (
+        SELECT id, parent_id, name FROM cloudfiles WHERE {RESTORE_SCOPE_CONDITION}
+    )
+    SELECT DISTINCT r.name FROM restoring r
+    JOIN cloudfiles live ON live.user_id = :user_id
+        AND live.name = r.name
+        AND live.parent_id IS NOT DISTINCT FROM r.parent_id
+        AND live.deleted_at IS NULL
+""")
+
+RESTORE_FILES_SQL = text(f"""
+    UPDATE cloudfiles SET deleted_at = NULL
+    WHERE {RESTORE_SCOPE_CONDITION}
+    RETURNING id, name, is_folder, online_editable
+""")
+
+RESTORE_CONTENTS_SQL = text("""
+    UPDATE filecontent SET deleted_at = NULL
+    WHERE user_id = :user_id AND id = ANY(CAST(:file_ids AS uuid[]))
+""")
+
+def _restore_params(user_id, root):
+    return {
+        'user_id': user_id,
+        'root_id': str(root.id),
+        'ancestor_ids': [str(a) for a in (root.ancestors or [])]
+    }
+
+# 返回恢复 root 时会与现有文件/文件夹重名的名称列表，为空表示无冲突
+def find_restore_conflicts(user_id, root):
+    return [row.name for row in db.session.execute(RESTORE_CONFLICT_SQL, _restore_params(user_id, root))]
+
+# 恢复 root（Cloudfiles）及其所有已删除的子孙和祖先文件夹，同时恢复在线编辑文件的 filecontent
+# 返回被恢复的行（id, name, is_folder, online_editable）；不提交事务，由调用方 commit/rollback
+def restore_subtree(user_id, root):
+    rows = db.session.execute(RESTORE_FILES_SQL, _restore_params(user_id, root)).all()
+    apply_files_stats(user_id, [row.id for row in rows if not row.is_folder], 1)
+    content_ids = [str(row.id) for row in rows if not row.is_folder and row.online_editable]
+    if content_ids:
+        db.session.execute(RESTORE_CONTENTS_SQL, {'user_id': user_id, 'file_ids': content_ids})
+    return rows
@@ -184,6 +184,91 @@ class InputValidator:
             return True
         return select_code in ("1", "2")
 
+    @staticmethod
+    def validate_sort_by(sort_by):
+        """
+        验证 sort_by 是否合法："name", "size", "updated_at"，或None。
+        """
+        if sort_by is None:
+            return True
+        return sort_by in ("name", "size", "updated_at")
+
+    @staticmethod
+    def validate_sort_order(order):
+        """
+        验证 order 是否合法："asc", "desc"，或None。
+        """
+        if order is None:
+            return True
+        return order in ("asc", "desc")
+
+    @staticmethod
+    def validate_cursor(cursor):
+        """
+        验证分页游标是否合法：Base64字符串，限制最大长度 1024。
+        """
+        if not isinstance(cursor, str) or not 0 < len(cursor) <= 1024:
+            return False
+        return re.match(r"^[A-Za-z0-9_\-=]+$", cursor) is not None
+
+    @staticmethod
+    def validate_file_suffix(file_suffix):
+        """
+        验证文件后缀是否合法：仅允许字母、数字，可带前导点，限制长度 1 到 20，或None。
+        """
+        if file_suffix is None:
+            return True
+        if not isinstance(file_suffix, str) or not 1 <= len(file_suffix) <= 20:
+            return False
+        return re.match(r"^\.?[a-zA-Z0-9]+$", file_suffix) is not None
+
+    @staticmethod
+    def validate_search_keyword(keyword):
+        """
+        验证全文检索关键字是否合法：去除首尾空白后长度 1 到 100。
+        """
+        return isinstance(keyword, str) and 1 <= len(keyword.strip()) <= 100
+
+    @staticmethod
+    def validate_reservation_id(reservation_id):
+        """
+        验证上传配额预留ID是否合法：32位十六进制字符串，或None。
+        """
+        if reservation_id is None:
+            return True
+        return isinstance(reservation_id, str) and re.match(r"^[0-9a-f]{32}$", reservation_id) is not None
+
+    @staticmethod
+    def validate_content_hash(content_hash):
+        """
+        验证内容哈希是否合法：64位十六进制字符串（SHA-256），或None。
+        """
+        if content_hash is None:
+            return True
+        return isinstance(content_hash, str) and re.match(r"^[0-9a-f]{64}$", content_hash) is not None
+
+    @staticmethod
+    def validate_patch_ops(ops):
+        """
+        验证增量保存的修改段是否合法：[start, deleteCount, insertText] 的列表，start、deleteCount 为非负整数，
+        按 start 升序且互不重叠，段数不超过 10000，插入内容合计不超过 10MB。
+        """
+        if not isinstance(ops, list) or len(ops) > 10000:
+            return False
+        position = 0
+        insert_length = 0
+        for op in ops:
+            if not isinstance(op, list) or len(op) != 3:
+                return False
+            start, delete_count, insert_text = op
+            if not all(isinstance(n, int) and not isinstance(n, bool) and n >= 0 for n in (start, delete_count)):
+                return False
+            if not isinstance(insert_text, str) or start < position:
+                return False
+            position = start + delete_count
+            insert_length += len(insert_text)
+        return insert_length <= 10485760
+
     @staticmethod
     def validate_file_name(file_name):
         """
@@ -1,4 +1,6 @@
 import requests
+import json
+from extensions import redis_client
 
 # 获取临时访问URL，有效期为一小时，在node端配置
 # download_flag = 1时，需设置file_name，浏览器默认事件为下载
@@ -54,3 +56,24 @@ def delete_file(oss_filepath):
     except Exception as e:
         print(e)
         return False
+
+OSS_PURGE_QUEUE = 'oss_purge'
+OSS_PURGE_BATCH_SIZE = 1000 # OSS批量删除接口单次最多1000个对象
+
+# 将待删除的OSS对象路径放入删除队列，由 oss-purge-worker 批量删除并负责重试
+# 每条消息最多1000个路径，返回是否成功入队
+def enqueue_oss_purge(oss_paths):
+    if not oss_paths:
+        return True
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for i in range(0, len(oss_paths), OSS_PURGE_BATCH_SIZE):
+            pipe.lpush(OSS_PURGE_QUEUE, json.dumps({
+                'keys': oss_paths[i:i + OSS_PURGE_BATCH_SIZE],
+                'attempts': 0
+            }))
+        pipe.execute()
+        return True
+    except Exception as e:
+        print(f"OSS purge enqueue error: {e}, keys: {oss_paths}")
+        return False
@@ -0,0 +1,117 @@
+import uuid
+import time
+from extensions import db, redis_client
+from models import UserStorageQuota
+
+# 上传配额预留：前端直传OSS前先预留文件大小，配额不足时在签发STS前就拒绝，避免无效的OSS上传
+#   quota:{user_id}               哈希，PostgreSQL 中 upload_limit / upload_used 的镜像，按需从数据库加载
+#   quota-resv:{user_id}          有序集合，member 为预留ID，score 为过期时间戳
+#   quota-resv-size:{user_id}     哈希，预留ID -> 预留大小
+# 预留的检查与写入在 Lua 中原子完成：镜像的 used + 未过期预留合计 + 本次大小 <= limit；
+# 过期的预留在每次预留时顺带清理。PostgreSQL 仍是配额的权威数据，insert-file 时照常做带条件的 UPDATE，
+# 并把变化量同步到镜像；其他修改配额的途径（管理员修改上限、ZIP导入、对账）直接删除镜像，下次预留时重新加载。
+QUOTA_MIRROR_EX = 600
+RESERVATION_EX = 1800
+
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[2], unpack(expired))
+    redis.call('HDEL', KEYS[3], unpack(expired))
+end
+local reserved = 0
+for _, size in ipairs(redis.call('HVALS', KEYS[3])) do
+    reserved = reserved + tonumber(size)
+end
+local limit = tonumber(redis.call('HGET', KEYS[1], 'upload_limit'))
+local used = tonumber(redis.call('HGET', KEYS[1], 'upload_used'))
+if used + reserved + tonumber(ARGV[2]) > limit then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[3])
+redis.call('HSET', KEYS[3], ARGV[3], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+return 1
+"""
+
+# 镜像存在时才累加，镜像不存在时下次预留会从数据库加载最新值
+APPLY_DELTA_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], 'upload_used', ARGV[1])
+end
+return nil
+"""
+
+
+def _keys(user_id):
+    return f"quota:{user_id}", f"quota-resv:{user_id}", f"quota-resv-size:{user_id}"
+
+
+def _load_mirror(user_id):
+    quota = db.session.query(UserStorageQuota.upload_limit, UserStorageQuota.upload_used).filter(
+        UserStorageQuota.user_id == user_id
+    ).first()
+    if quota is None:
+        return False
+    mirror_key = _keys(user_id)[0]
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hset(mirror_key, mapping={'upload_limit': quota.upload_limit, 'upload_used': quota.upload_used})
+    pipe.expire(mirror_key, QUOTA_MIRROR_EX)
+    pipe.execute()
+    return True
+
+# 预留 size 字节的上传配额，成功返回预留ID，配额不足返回 None
+# Redis 异常时向上抛出，由调用方决定是否放行（insert-file 时仍会在数据库中检查配额）
+def reserve_upload(user_id, size, ex=RESERVATION_EX):
+    reservation_id = uuid.uuid4().hex
+    now = time.time()
+    args = [now, int(size), reservation_id, now + ex, ex]
+    result = redis_client.eval(RESERVE_SCRIPT, 3, *_keys(user_id), *args)
+    if result == -1:
+        if not _load_mirror(user_id):
+            return None
+        result = redis_client.eval(RESERVE_SCRIPT, 3, *_keys(user_id), *args)
+    return reservation_id if result == 1 else None
+
+# 释放预留（上传完成并记录，或上传失败、取消时调用），预留不存在时忽略
+def release_upload(user_id, reservation_id):
+    if not reservation_id:
+        return
+    _, resv_key, resv_size_key = _keys(user_id)
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.zrem(resv_key, reservation_id)
+        pipe.hdel(resv_size_key, reservation_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis release error: {e}")
+
+# 数据库中的 upload_used 变化后同步到镜像（提交后调用）
+def apply_upload_used_delta(user_id, delta):
+    if not delta:
+        return
+    try:
+        redis_client.eval(APPLY_DELTA_SCRIPT, 1, _keys(user_id)[0], int(delta))
+    except Exception as e:
+        print(f"Redis eval error: {e}")
+        invalidate_quota_mirror(user_id)
+
+# 删除镜像，下次预留时从数据库重新加载
+def invalidate_quota_mirror(user_id):
+    try:
+        redis_client.delete(_keys(user_id)[0])
+    except Exception as e:
+        print(f"Redis delete error: {e}")
+
+# 批量删除镜像（配额对账修正后调用）
+def invalidate_quota_mirrors(user_ids):
+    if not user_ids:
+        return
+    try:
+        redis_client.delete(*[_keys(user_id)[0] for user_id in user_ids])
+    except Exception as e:
+        print(f"Redis delete error: {e}")
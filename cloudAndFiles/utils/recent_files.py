@@ -0,0 +1,203 @@
+import json
+import secrets
+from datetime import timezone
+from extensions import db, redis_client
+from models import Cloudfiles
+from utils.utils import json_dumps
+
+# 最近文件索引：每个用户一个按 updated_at 排序的有序集合 + 一个元数据哈希
+#   recent-files:{user_id}:z     有序集合，member 为文件ID，score 为 updated_at 的时间戳
+#   recent-files:{user_id}:meta  哈希，文件ID -> 已编码的元数据 JSON（updated_at 已是字符串，读取时无需再解析时间）
+#   recent-files:{user_id}:ready 标记索引已由数据库重建，值为 complete（索引含该用户全部文件）或 partial（已被截断）
+# 文件新增、保存、重命名、移动时 ZADD，删除时 ZREM，超过 RECENT_FILES_CAPACITY 条时截断；
+# 删除文件夹、恢复、ZIP导入等涉及多个文件的操作直接重置索引，下次读取时从数据库重建。
+# 路径不存入索引，读取时按 parent_id 批量查路径缓存，文件夹移动、重命名无需维护索引。
+#   recent-files:{user_id}:ver   版本号，索引每次变化（含重建）时更换为新的随机值，与路径缓存代数一起生成 ETag
+RECENT_FILES_LIMIT = 20
+# 多保留一些条目，删除若干文件后仍能直接返回 RECENT_FILES_LIMIT 条
+RECENT_FILES_CAPACITY = RECENT_FILES_LIMIT * 2
+RECENT_FILES_EX = 86400
+
+RECENT_FILES_COLUMNS = (
+    Cloudfiles.id, Cloudfiles.parent_id, Cloudfiles.name, Cloudfiles.size,
+    Cloudfiles.updated_at, Cloudfiles.online_editable, Cloudfiles.oss_path
+)
+
+# 批量 ZADD + HSET，截断到 capacity 条并删除被截断条目的元数据；发生截断时将 ready 标记改为 partial
+# KEYS: z, meta, ready；ARGV: capacity, ttl, 之后每三个为 score, 文件ID, 元数据JSON
+UPSERT_SCRIPT = """
+for i = 3, #ARGV, 3 do
+    redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+    redis.call('HSET', KEYS[2], ARGV[i + 1], ARGV[i + 2])
+end
+local capacity = tonumber(ARGV[1])
+local stale = redis.call('ZRANGE', KEYS[1], 0, -(capacity + 1))
+if #stale > 0 then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(capacity + 1))
+    redis.call('HDEL', KEYS[2], unpack(stale))
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        redis.call('SET', KEYS[3], 'partial', 'EX', ARGV[2])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return #stale
+"""
+
+# 重建：版本号仍为读数据库之前取得的值时，清空索引后写入数据库中的条目，设置 ready 标记并更换版本号；
+# 版本号已变化说明读数据库期间索引有更新或重置，不写入（数据库快照可能已过时），返回 0
+# KEYS: z, meta, ready, ver；ARGV: 读数据库前的版本号（不存在为空串）, ttl, ready 值, 新版本号, 之后每三个为 score, 文件ID, 元数据JSON
+REBUILD_SCRIPT = """
+if (redis.call('GET', KEYS[4]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+for i = 5, #ARGV, 3 do
+    redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+    redis.call('HSET', KEYS[2], ARGV[i + 1], ARGV[i + 2])
+end
+if #ARGV >= 5 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+redis.call('SET', KEYS[3], ARGV[3], 'EX', ARGV[2])
+redis.call('SET', KEYS[4], ARGV[4], 'EX', ARGV[2])
+return 1
+"""
+
+
+def _keys(user_id):
+    prefix = f"recent-files:{user_id}"
+    return f"{prefix}:z", f"{prefix}:meta", f"{prefix}:ready"
+
+
+def _version_key(user_id):
+    return f"recent-files:{user_id}:ver"
+
+
+def _set_version(pipe, user_id):
+    pipe.set(_version_key(user_id), secrets.token_hex(8), ex=RECENT_FILES_EX)
+
+
+def _score(updated_at):
+    return updated_at.replace(tzinfo=timezone.utc).timestamp() if updated_at else 0
+
+
+def _encode(row):
+    return json_dumps({
+        'id': str(row.id),
+        'parent_id': str(row.parent_id) if row.parent_id else None,
+        'name': row.name,
+        'size': row.size,
+        'updated_at': row.updated_at,
+        'online_editable': row.online_editable,
+        'oss_path': row.oss_path
+    })
+
+
+def _upsert_args(rows):
+    args = [RECENT_FILES_CAPACITY, RECENT_FILES_EX]
+    for row in rows:
+        args.extend([_score(row.updated_at), str(row.id), _encode(row)])
+    return args
+
+# 文件新增或元数据变化（保存、重命名、移动）后调用，rows 为含 RECENT_FILES_COLUMNS 字段的对象（Cloudfiles 或查询行）
+# 索引尚未重建时写入的条目会在重建时被清除，因此无需先检查 ready 标记
+def recent_files_upsert(user_id, rows):
+    if not rows:
+        return
+    z_key, meta_key, ready_key = _keys(user_id)
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.eval(UPSERT_SCRIPT, 3, z_key, meta_key, ready_key, *_upsert_args(rows))
+        _set_version(pipe, user_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis eval error: {e}")
+        recent_files_reset(user_id)
+
+# 文件被删除后调用
+def recent_files_remove(user_id, file_ids):
+    if not file_ids:
+        return
+    z_key, meta_key, _ = _keys(user_id)
+    members = [str(file_id) for file_id in file_ids]
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.zrem(z_key, *members)
+        pipe.hdel(meta_key, *members)
+        _set_version(pipe, user_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis zrem error: {e}")
+        recent_files_reset(user_id)
+
+# 重置索引，下次读取时从数据库重建
+def recent_files_reset(user_id):
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(*_keys(user_id))
+        _set_version(pipe, user_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis delete error: {e}")
+
+# 从数据库取最近的 RECENT_FILES_CAPACITY 个文件重建索引，返回按 updated_at 降序的元数据 JSON 列表
+# 先取版本号再读数据库，读数据库期间索引有变化（或取版本号失败）时只返回结果、不写入索引
+def _rebuild(user_id):
+    try:
+        version = redis_client.get(_version_key(user_id))
+        expected_version = version.decode() if version is not None else ''
+    except Exception as e:
+        print(f"Redis get error: {e}")
+        expected_version = None
+    rows = db.session.query(*RECENT_FILES_COLUMNS).filter(
+        Cloudfiles.user_id == user_id,
+        Cloudfiles.is_folder == False,
+        Cloudfiles.deleted_at.is_(None)
+    ).order_by(Cloudfiles.updated_at.desc()).limit(RECENT_FILES_CAPACITY).all()
+    if expected_version is not None:
+        z_key, meta_key, ready_key = _keys(user_id)
+        try:
+            redis_client.eval(
+                REBUILD_SCRIPT, 4, z_key, meta_key, ready_key, _version_key(user_id),
+                expected_version, RECENT_FILES_EX, 'complete' if len(rows) < RECENT_FILES_CAPACITY else 'partial',
+                secrets.token_hex(8), *_upsert_args(rows)[2:]
+            )
+        except Exception as e:
+            print(f"Redis rebuild error: {e}")
+    return [_encode(row) for row in rows[:RECENT_FILES_LIMIT]]
+
+# 读取最近修改的 RECENT_FILES_LIMIT 个文件，返回 (元数据字典列表, 是否命中索引)
+#   命中：一次 pipeline 取 ready 标记与 ZREVRANGE，再一次 HMGET 取元数据
+#   未重建，或已截断且剩余不足 RECENT_FILES_LIMIT 条时，从数据库重建
+def get_recent_files_index(user_id):
+    z_key, meta_key, ready_key = _keys(user_id)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(ready_key)
+        pipe.zrevrange(z_key, 0, RECENT_FILES_LIMIT - 1)
+        ready, file_ids = pipe.execute()
+        if ready is not None and (len(file_ids) >= RECENT_FILES_LIMIT or ready == b'complete'):
+            entries = redis_client.hmget(meta_key, file_ids) if file_ids else []
+            if all(entry is not None for entry in entries):
+                return [json.loads(entry) for entry in entries], True
+    except Exception as e:
+        print(f"Redis get error: {e}")
+    return [json.loads(entry) for entry in _rebuild(user_id)], False
+
+# 索引的当前版本号，不存在时先写入随机值；Redis 异常时返回 None（不做条件请求）
+# 需在读取索引之前调用：先取版本号再取数据，返回的 ETag 最多比数据旧，不会出现新 ETag 配旧数据
+def get_recent_files_version(user_id):
+    version_key = _version_key(user_id)
+    try:
+        version = redis_client.get(version_key)
+        if version is None:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(version_key, secrets.token_hex(8), ex=RECENT_FILES_EX, nx=True)
+            pipe.get(version_key)
+            version = pipe.execute()[-1]
+        return version.decode()
+    except Exception as e:
+        print(f"Redis get error: {e}")
+        return None
@@ -0,0 +1,181 @@
+import json
+import zlib
+import difflib
+from sqlalchemy import text
+from extensions import db
+from models import FilecontentRevisions
+
+# 在线编辑文件的历史版本
+# filecontent 始终保存最新内容（读取最新版本仍是单行读取），filecontent.version 为其版本号；
+# 每次保存时把被覆盖的旧内容写入 filecontent_revisions，按反向增量存储：
+#   kind = 'delta'  data 为修改段，作用于下一个（更新的）历史版本或最新内容即得到本版本
+#   kind = 'full'   data 为完整内容；从最新一侧起连续的 delta 达到 REVISION_SNAPSHOT_INTERVAL - 1 个时写一次全量
+# 读取版本 r：从 r 起向新版本方向找到最近的 full（找不到则取最新内容），再依次反向应用其间的 delta，链长不超过快照间隔
+# 旧版本只依赖更新的版本，因此删除最旧的若干版本不影响其余版本；版本号可以不连续
+# data 均为 zlib 压缩，delta 的修改段为 [start, deleteCount, insertText] 的列表（以 Python 字符下标计）
+#
+# 自动保存频繁，距上一个历史版本不足 REVISION_MIN_INTERVAL 秒的保存不单独记录（合并到下一次），
+# 每个文件最多保留 REVISION_KEEP_COUNT 个历史版本；按时间的保留与稀疏化见 jobs.compact_revisions
+REVISION_SNAPSHOT_INTERVAL = 20
+REVISION_MIN_INTERVAL = 300
+REVISION_KEEP_COUNT = 100
+REVISION_KIND_FULL = 'full'
+REVISION_KIND_DELTA = 'delta'
+# 去掉公共前后缀后，中间部分超过该长度时按行比较，生成多个修改段
+LINE_DIFF_THRESHOLD = 4096
+
+
+def _common_prefix_length(a, b):
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+# 计算把 source 变为 target 的修改段
+def compute_delta(source, target):
+    prefix = _common_prefix_length(source, target)
+    suffix = _common_suffix_length(source, target, min(len(source), len(target)) - prefix)
+    source_middle = source[prefix:len(source) - suffix]
+    target_middle = target[prefix:len(target) - suffix]
+    if not source_middle and not target_middle:
+        return []
+    if len(source_middle) + len(target_middle) <= LINE_DIFF_THRESHOLD:
+        return [[prefix, len(source_middle), target_middle]]
+    source_lines = source_middle.splitlines(keepends=True)
+    target_lines = target_middle.splitlines(keepends=True)
+    offsets = [prefix]
+    for line in source_lines:
+        offsets.append(offsets[-1] + len(line))
+    ops = []
+    matcher = difflib.SequenceMatcher(None, source_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            ops.append([offsets[i1], offsets[i2] - offsets[i1], ''.join(target_lines[j1:j2])])
+    return ops
+
+# 在 content 上应用 compute_delta 生成的修改段
+def apply_delta(content, ops):
+    parts = []
+    position = 0
+    for start, delete_count, insert_text in ops:
+        parts.append(content[position:start])
+        parts.append(insert_text)
+        position = start + delete_count
+    parts.append(content[position:])
+    return ''.join(parts)
+
+
+def _encode_full(content):
+    return zlib.compress((content or '').encode('utf-8'))
+
+
+def _encode_delta(ops):
+    return zlib.compress(json.dumps(ops, ensure_ascii=False).encode('utf-8'))
+
+
+def _decode(row):
+    raw = zlib.decompress(bytes(row.data)).decode('utf-8')
+    return raw if row.kind == REVISION_KIND_FULL else json.loads(raw)
+
+# 从最新内容（newer_content）出发，沿 rows（按版本号降序）依次还原各历史版本的内容，逐个产出 (row, content)
+def iter_revision_contents(newer_content, rows):
+    content = newer_content
+    for row in rows:
+        decoded = _decode(row)
+        content = decoded if row.kind == REVISION_KIND_FULL else apply_delta(content, decoded)
+        yield row, content
+
+# 把旧内容编码为历史版本：newer_content 为其下一个更新的版本（或最新内容），deltas_above 为其上方连续的 delta 数
+def encode_revision(old_content, newer_content, deltas_above):
+    if deltas_above >= REVISION_SNAPSHOT_INTERVAL - 1:
+        return REVISION_KIND_FULL, _encode_full(old_content)
+    return REVISION_KIND_DELTA, _encode_delta(compute_delta(newer_content, old_content))
+
+PRUNE_REVISIONS_SQL = text("""
+    DELETE FROM filecontent_revisions
+    WHERE file_id = :file_id AND revision <= (
+        SELECT revision FROM filecontent_revisions
+        WHERE file_id = :file_id
+        ORDER BY revision DESC
+        OFFSET :keep_count LIMIT 1
+    )
+""")
+
+# 保存前调用：file_content 的内容将从 old_content 变为 new_content，把 old_content 记为历史版本并递增版本号
+# 调用方需已锁定 file_content 行（with_for_update），不提交事务
+def record_revision(file_content, old_content, new_content):
+    if old_content == new_content:
+        return
+    old_version = file_content.version or 1
+    recent = FilecontentRevisions.query.filter_by(file_id=file_content.id).order_by(
+        FilecontentRevisions.revision.desc()
+    ).limit(REVISION_SNAPSHOT_INTERVAL).all()
+    top = recent[0] if recent else None
+    if (top is not None and top.saved_at and file_content.updated_at
+            and (file_content.updated_at - top.saved_at).total_seconds() < REVISION_MIN_INTERVAL):
+        # 距上一个历史版本太近：不记录 old_content，上一个历史版本的增量改为相对新内容
+        if top.kind == REVISION_KIND_DELTA:
+            top_content = apply_delta(old_content, _decode(top))
+            top.data = _encode_delta(compute_delta(new_content, top_content))
+    else:
+        deltas_above = 0
+        for row in recent:
+            if row.kind == REVISION_KIND_FULL:
+                break
+            deltas_above += 1
+        kind, data = encode_revision(old_content, new_content, deltas_above)
+        db.session.add(FilecontentRevisions(
+            file_id=file_content.id,
+            revision=old_version,
+            user_id=file_content.user_id,
+            kind=kind,
+            data=data,
+            size=len((old_content or '').encode('utf-8')),
+            saved_at=file_content.updated_at
+        ))
+        db.session.flush()
+        db.session.execute(PRUNE_REVISIONS_SQL, {'file_id': file_content.id, 'keep_count': REVISION_KEEP_COUNT})
+    file_content.version = old_version + 1
+
+# 返回文件的历史版本列表（不含最新版本），按版本号降序
+def list_revisions(file_id):
+    return db.session.query(
+        FilecontentRevisions.revision, FilecontentRevisions.size, FilecontentRevisions.saved_at
+    ).filter(FilecontentRevisions.file_id == file_id).order_by(FilecontentRevisions.revision.desc()).all()
+
+# 读取版本 revision 的内容，版本不存在时返回 None；current_content 为 filecontent 中的最新内容
+def get_revision_content(file_id, revision, current_content):
+    target = db.session.query(FilecontentRevisions.revision).filter_by(file_id=file_id, revision=revision).first()
+    if target is None:
+        return None
+    # 从 revision 起向新版本方向最近的全量版本，以它（或最新内容）为起点
+    snapshot = db.session.query(db.func.min(FilecontentRevisions.revision)).filter(
+        FilecontentRevisions.file_id == file_id,
+        FilecontentRevisions.revision >= revision,
+        FilecontentRevisions.kind == REVISION_KIND_FULL
+    ).scalar()
+    query = FilecontentRevisions.query.filter(
+        FilecontentRevisions.file_id == file_id,
+        FilecontentRevisions.revision >= revision
+    )
+    if snapshot is not None:
+        query = query.filter(FilecontentRevisions.revision <= snapshot)
+    content = current_content
+    for _, content in iter_revision_contents(current_content, query.order_by(FilecontentRevisions.revision.desc())):
+        pass
+    return content
@@ -0,0 +1,28 @@
+import hashlib
+
+# 在线编辑的增量保存
+# 编辑器自动保存时只提交相对上一次保存内容（baseHash）的修改，服务端校验哈希后在数据库中的内容上应用：
+#   ops 为 [start, deleteCount, insertText] 的列表，start / deleteCount 以 UTF-16 码元计（即 JS 字符串下标），
+#   均相对于 base 内容，按 start 升序且互不重叠
+# base 与数据库中的内容不一致（其他标签页或设备已保存）时拒绝，前端改为提交全文
+
+# 内容哈希：UTF-8 编码后的 SHA-256 十六进制串，前端保存后以此作为下一次增量保存的 baseHash
+def content_hash(content):
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+# 在 content 上应用 ops 并返回新内容；ops 越界、重叠或切开代理对时抛出 ValueError
+def apply_patch(content, ops):
+    # 按 UTF-16 处理，下标与前端一致；每个码元 2 字节
+    encoded = (content or '').encode('utf-16-le')
+    parts = []
+    position = 0
+    for start, delete_count, insert_text in ops:
+        begin, end = start * 2, (start + delete_count) * 2
+        if begin < position or end > len(encoded):
+            raise ValueError('patch out of range')
+        parts.append(encoded[position:begin])
+        parts.append(insert_text.encode('utf-16-le'))
+        position = end
+    parts.append(encoded[position:])
+    # 修改点切开了代理对时解码失败
+    return b''.join(parts).decode('utf-16-le')
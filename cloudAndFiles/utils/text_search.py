@@ -0,0 +1,122 @@
+import re
+from sqlalchemy import text
+from extensions import db
+
+# 在线编辑文件内容的全文检索
+# PostgreSQL 自带的分词器不会切分中日韩文字（整段连续的汉字会成为一个词），
+# 因此写入 tsvector 前先在 Python 中把连续的中日韩文字切成重叠的二元组（bigram）：
+#   "云盘文件" -> "云盘 盘文 文件 件"
+# 查询时用同样的方式切分，再用 phraseto_tsquery 要求二元组相邻，即可实现任意子串匹配。
+# 拉丁字母、数字等仍交给 PostgreSQL 的 simple 配置分词（转小写，不做词干提取）。
+
+SEARCH_CONFIG = 'simple'
+
+# 写入 tsvector 的最大字符数，避免超长文档超出 tsvector 的大小限制
+SEARCH_MAX_CHARS = 100000
+
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+')
+
+
+def _split_cjk_run(run, for_query):
+    if len(run) == 1:
+        return run
+    bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+    # 索引时保留末尾单字，使单字查询（前缀匹配）也能命中连续汉字的最后一个字
+    if not for_query:
+        bigrams.append(run[-1])
+    return ' '.join(bigrams)
+
+# 将文本中的连续中日韩文字切成二元组，其余字符保持不变
+def prepare_search_text(content, for_query=False):
+    if not content:
+        return ''
+    return CJK_RE.sub(lambda m: f' {_split_cjk_run(m.group(0), for_query)} ', content)
+
+# 生成写入 filecontent.search_vector 的 SQL 表达式，可直接赋值给 ORM 字段
+def build_search_vector(content):
+    return db.func.to_tsvector(SEARCH_CONFIG, prepare_search_text((content or '')[:SEARCH_MAX_CHARS]))
+
+# 将搜索关键字解析为 tsquery 的 SQL 片段，返回 (sql, params, terms)
+#   - 关键字按空白切分，各词之间为 AND
+#   - 每个词用 phraseto_tsquery 要求其中的 token 相邻
+#   - 单个中日韩文字用前缀匹配（索引中只有二元组和末尾单字）
+#   - terms 为切分后的原始词，用于计算高亮位置
+def build_tsquery(keyword):
+    terms = keyword.split()
+    parts = []
+    params = {'search_config': SEARCH_CONFIG}
+    for i, term in enumerate(terms):
+        name = f'term_{i}'
+        if len(term) == 1 and CJK_RE.fullmatch(term):
+            parts.append(f"to_tsquery(CAST(:search_config AS regconfig), :{name})")
+            params[name] = f"'{term}':*"
+        else:
+            parts.append(f"phraseto_tsquery(CAST(:search_config AS regconfig), :{name})")
+            params[name] = prepare_search_text(term, for_query=True)
+    return ' && '.join(parts), params, terms
+
+# 计算各搜索词在片段中出现的位置，返回按起点排序、互不重叠的 [start, end) 列表（字符下标）
+def highlight_offsets(snippet, terms):
+    spans = []
+    for term in terms:
+        for match in re.finditer(re.escape(term), snippet, re.IGNORECASE):
+            spans.append([match.start(), match.end()])
+    spans.sort()
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+# 片段取第一个搜索词首次出现位置前 SNIPPET_CONTEXT 个字符起的 SNIPPET_LENGTH 个字符
+SNIPPET_CONTEXT = 40
+SNIPPET_LENGTH = 160
+
+# 从内容中截取片段，返回 (snippet, 片段前是否还有内容)
+def build_snippet(content, terms):
+    content = content or ''
+    position = content.lower().find(terms[0].lower()) if terms else -1
+    start = max(position - SNIPPET_CONTEXT, 0)
+    return content[start:start + SNIPPET_LENGTH], start > 0
+
+# 内容检索：先在 hits 中用 GIN 索引过滤、排序、分页，再只取当前页的内容
+# 内容可能是压缩存储的（见 utils.content_codec），片段由调用方解压后用 build_snippet 截取
+SEARCH_CONTENT_SQL = """
+    WITH query AS (
+        SELECT {tsquery} AS q
+    ), hits AS (
+        SELECT f.id, CAST(ts_rank_cd(f.search_vector, query.q) AS double precision) AS score
+        FROM filecontent f, query
+        WHERE f.user_id = :user_id AND f.deleted_at IS NULL AND f.search_vector @@ query.q
+        {cursor_condition}
+        ORDER BY score DESC, f.id DESC
+        LIMIT :limit
+    )
+    SELECT hits.id, hits.score, f.name, f.file_suffix, f.updated_at, c.parent_id, c.size,
+           f.content, f.content_codec, f.content_blob
+    FROM hits
+    JOIN filecontent f ON f.id = hits.id
+    JOIN cloudfiles c ON c.id = hits.id
+    ORDER BY hits.score DESC, hits.id DESC
+"""
+
+SEARCH_CURSOR_CONDITION = """
+        AND (CAST(ts_rank_cd(f.search_vector, query.q) AS double precision), f.id) < (CAST(:last_score AS double precision), CAST(:last_id AS uuid))
+"""
+
+# 在当前用户未删除的在线编辑文件中检索 keyword，返回当前页的行（最多 limit 条）
+# cursor 为上一页最后一行的 (score, id)，为 None 时从第一页开始
+# ts_rank_cd 返回 real，分数统一转为 double precision：游标中的分数为 Python float，按 real 比较时分页边界上会跳过或重复返回行
+def search_contents(user_id, keyword, limit, cursor=None):
+    tsquery, params, terms = build_tsquery(keyword)
+    if not terms:
+        return [], terms
+    params.update({'user_id': user_id, 'limit': limit})
+    cursor_condition = ''
+    if cursor is not None:
+        cursor_condition = SEARCH_CURSOR_CONDITION
+        params['last_score'], params['last_id'] = cursor
+    sql = text(SEARCH_CONTENT_SQL.format(tsquery=tsquery, cursor_condition=cursor_condition))
+    return db.session.execute(sql, params).all(), terms
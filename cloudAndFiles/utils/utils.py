@@ -3,19 +3,69 @@ import base64
 import uuid
 import secrets
 import json
-from extensions import redis_client
-from models import Cloudfiles, Users
-from datetime import datetime
-from flask import jsonify
+import hashlib
+from extensions import db, redis_client
+from models import Users
+from sqlalchemy import text
+from datetime import datetime, date, timezone
+from decimal import Decimal
+from flask import current_app, request
 import requests
 from cryptography.fernet import Fernet
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON 编码：优先使用 orjson（原生支持 UUID、datetime，编码结果直接为 bytes），未安装时退回标准库
+# 两种方式输出一致：无时区的 datetime 按 UTC 输出为 ISO 8601（如 2024-01-01T12:00:00+00:00），
+# 与原先 jsonify 输出的 "Mon, 01 Jan 2024 12:00:00 GMT" 表示同一时刻，前端解析结果不变
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return (obj if obj.tzinfo else obj.replace(tzinfo=timezone.utc)).isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, Decimal)):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+if orjson is not None:
+    def json_dumps(data):
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_NAIVE_UTC)
+else:
+    def json_dumps(data):
+        return json.dumps(data, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
 
 def json_response_creator(code, message, data=None):
-    return jsonify({
+    return current_app.response_class(json_dumps({
         "code": code,
         "message": message,
         "data": data
-    })
+    }), mimetype='application/json')
+
+# data 为已编码的 JSON（bytes），直接拼接进响应体，不再解码、重新编码，用于返回缓存内容
+def json_raw_response_creator(code, message, raw_data):
+    return current_app.response_class(
+        b'{"code":' + json_dumps(code) + b',"message":' + json_dumps(message) + b',"data":' + raw_data + b'}',
+        mimetype='application/json'
+    )
+
+# 由若干版本号、时间戳等生成强 ETag：同一份数据的 parts 相同，数据变化时至少一项变化
+def make_etag(*parts):
+    return hashlib.sha1(json_dumps(parts)).hexdigest()
+
+# 条件请求：请求头 If-None-Match 中含有 etag 时返回 304 响应（不再查询、编码数据），否则返回 None
+def not_modified_response(etag):
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return set_etag_headers(current_app.response_class(status=304), etag)
+    return None
+
+# 设置 ETag，并要求浏览器每次使用缓存前先带 If-None-Match 校验（仅浏览器私有缓存）
+def set_etag_headers(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # 密码hash值生成
 def generate_password_hash(password):
@@ -75,54 +125,135 @@ def email_usable_validator(email):
     """
     return Users.query.filter_by(email=email).first() is None
 
-# 取消缓存最近文件列表
-def invalidate_recent_files_cache(user_id):
-    redis_key = f"recent_files:{user_id}"
-    redis_client.delete(redis_key)
+RECYCLE_BIN_COUNT_SQL = text("""
+    SELECT COUNT(*) FROM cloudfiles WHERE user_id = :user_id AND deleted_at IS NOT NULL
+""")
+
+# 回收站条数缓存，回收站内容变化（删除、恢复、物理删除）时清除，下次读取时重新统计
+def get_recycle_bin_count(user_id, ex=86400):
+    redis_key = f"recycle_bin_count:{user_id}"
+    try:
+        cached = redis_client.get(redis_key)
+        if cached is not None:
+            return int(cached)
+    except Exception as e:
+        print(f"Redis get error: {e}")
+    count = db.session.execute(RECYCLE_BIN_COUNT_SQL, {'user_id': user_id}).scalar()
+    try:
+        redis_client.set(redis_key, count, ex=ex)
+    except Exception as e:
+        print(f"Redis set error: {e}")
+    return count
 
-# 取消路径缓存
-def unset_folder_path_cache(folder_id):
+# 取消回收站条数缓存
+def invalidate_recycle_bin_count(user_id):
     try:
-        redis_client.delete(f"path-cache-id:{folder_id}")
+        redis_client.delete(f"recycle_bin_count:{user_id}")
     except Exception as e:
         print(f"Redis delete error: {e}")
 
-# 路径查找，加缓存，folder_id传文件的parent_id
-def get_folder_path(folder_id, ex=600):
-    cache_key = f"path-cache-id:{folder_id}"
+# 路径缓存有效期，失效依靠用户级代数计数器，因此可以设置得较长
+PATH_CACHE_EX = 6 * 3600
+
+# 路径缓存代数，路径缓存的key中带有代数，代数变化后旧缓存自然不再被读取，等待过期即可
+def get_folder_path_generation(user_id):
     try:
-        cached = redis_client.get(cache_key)
-        if cached is not None:
-            cached_data = json.loads(cached.decode())
-            # 将字符串格式的 updated_at 转换回 datetime 对象
-            for folder in cached_data['filePath']:
-                if folder['updated_at']:
-                    folder['updated_at'] = datetime.fromisoformat(folder['updated_at'])
-            return cached_data
+        generation = redis_client.get(f"path-cache-gen:{user_id}")
+        return int(generation) if generation is not None else 0
     except Exception as e:
         print(f"Redis get error: {e}")
-    file_path = []
-    current_id = folder_id
-    while current_id:
-        folder = Cloudfiles.query.filter_by(id=current_id).first()
-        if not folder:
-            break
-        file_path.insert(0, {
-            'id': str(folder.id),
-            'name': folder.name,
-            'updated_at': folder.updated_at.isoformat() if folder.updated_at else None
-        })
-        current_id = folder.parent_id
-    result = {'filePath': file_path}
+        return None
+
+# 取消路径缓存：文件夹移动、重命名后调用，一次INCR使该用户所有路径缓存失效
+def invalidate_folder_path_cache(user_id):
     try:
-        redis_client.set(cache_key, json.dumps(result), ex=ex)
+        redis_client.incr(f"path-cache-gen:{user_id}")
+    except Exception as e:
+        print(f"Redis incr error: {e}")
+
+# 从多个folder_id沿parent_id向上递归，一次取出每个folder_id的整条祖先链
+# leaf_id为起点folder_id，depth越大越靠近根目录；depth上限用于防止异常数据形成环时无限递归
+FOLDER_PATHS_SQL = text("""
+    WITH RECURSIVE chain AS (
+        SELECT id AS leaf_id, id, parent_id, name, updated_at, 0 AS depth
+        FROM cloudfiles
+        WHERE id = ANY(CAST(:folder_ids AS uuid[]))
+        UNION ALL
+        SELECT chain.leaf_id, c.id, c.parent_id, c.name, c.updated_at, chain.depth + 1
+        FROM cloudfiles c
+        JOIN chain ON c.id = chain.parent_id
+        WHERE chain.depth < 256
+    )
+    SELECT leaf_id, id, name, updated_at FROM chain ORDER BY leaf_id, depth DESC
+""")
+
+def _load_cached_folder_path(cached):
+    cached_data = json.loads(cached.decode())
+    # 将字符串格式的 updated_at 转换回 datetime 对象
+    for folder in cached_data['filePath']:
+        if folder['updated_at']:
+            folder['updated_at'] = datetime.fromisoformat(folder['updated_at'])
+    return cached_data
+
+# 批量路径查找，加缓存，parent_ids传文件的parent_id列表，user_id为文件所属用户
+# 返回 {parent_id: {'filePath': [...]}}，格式与 get_folder_path 一致
+#   - 缓存key带有用户的路径缓存代数，移动、重命名后一次INCR即可使全部路径缓存失效
+#   - 去重后用一次MGET取缓存
+#   - 未命中的用一次递归查询取出所有祖先链，再用pipeline回写缓存
+def get_folder_paths(parent_ids, user_id, ex=PATH_CACHE_EX):
+    unique_ids = list(dict.fromkeys(parent_ids))
+    results = {}
+    if not unique_ids:
+        return results
+    generation = get_folder_path_generation(user_id)
+    cache_keys = [f"path-cache-id:{user_id}:{generation}:{folder_id}" for folder_id in unique_ids]
+    cached_values = [None] * len(unique_ids)
+    if generation is not None:
+        try:
+            cached_values = redis_client.mget(cache_keys)
+        except Exception as e:
+            print(f"Redis mget error: {e}")
+    missed_ids = []
+    for folder_id, cached in zip(unique_ids, cached_values):
+        if cached is not None:
+            try:
+                results[folder_id] = _load_cached_folder_path(cached)
+                continue
+            except Exception as e:
+                print(f"Redis cache decode error: {e}")
+        missed_ids.append(folder_id)
+    if not missed_ids:
+        return results
+
+    file_paths = {str(folder_id): [] for folder_id in missed_ids if folder_id}
+    if file_paths:
+        rows = db.session.execute(FOLDER_PATHS_SQL, {'folder_ids': list(file_paths.keys())}).all()
+        for row in rows:
+            file_paths[str(row.leaf_id)].append({
+                'id': str(row.id),
+                'name': row.name,
+                'updated_at': row.updated_at.isoformat() if row.updated_at else None
+            })
+    for folder_id in missed_ids:
+        results[folder_id] = {'filePath': file_paths.get(str(folder_id), []) if folder_id else []}
+    if generation is None:
+        return results
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for folder_id in missed_ids:
+            pipe.set(f"path-cache-id:{user_id}:{generation}:{folder_id}", json.dumps(results[folder_id]), ex=ex)
+        pipe.execute()
     except Exception as e:
         print(f"Redis set error: {e}")
-    return result
+    return results
+
+# 路径查找，加缓存，folder_id传文件的parent_id
+def get_folder_path(folder_id, user_id, ex=PATH_CACHE_EX):
+    return get_folder_paths([folder_id], user_id, ex=ex)[folder_id]
 
 def get_path_from_parent_folder(file):
     # 用 parent_id 查找路径
-    path_info = get_folder_path(file.parent_id)
+    path_info = get_folder_path(file.parent_id, file.user_id)
     path = path_info.get('filePath', [])
 
     # 拼接 full_path
@@ -136,6 +267,99 @@ def get_path_from_parent_folder(file):
     path_info['full_path'] = full_path
     return path_info
 
+# 文件列表缓存有效期
+# 版本号为每次失效时新生成的随机值（不会与旧值重复），版本号key的有效期长于缓存，
+# 版本号key过期后重新生成随机值，过期前写入的缓存不会再被读取
+FILE_LIST_CACHE_EX = 3600
+FILE_LIST_VERSION_EX = FILE_LIST_CACHE_EX * 2
+FILE_LIST_CACHE_HITS_KEY = "file-list-cache:hits"
+FILE_LIST_CACHE_MISSES_KEY = "file-list-cache:misses"
+FILE_LIST_CACHE_INVALIDATIONS_KEY = "file-list-cache:invalidations"
+
+def _file_list_version_key(user_id, folder_id):
+    return f"file-list-ver:{user_id}:{folder_id or 'root'}"
+
+# 文件列表缓存key：用户版本号 + 文件夹版本号 + 查询参数的摘要，同时用于生成文件列表的 ETag
+#   - 单个文件夹内容变化时只更换该文件夹的版本号
+#   - 影响整棵子树的操作更换用户版本号，使该用户的全部列表缓存失效
+#   - 版本号不存在（尚未生成或已过期）时先写入随机值，不会与过期前的版本号重复，客户端持有的旧 ETag 不会误命中
+# Redis 异常时返回 None，调用方直接查库
+def get_file_list_cache_key(user_id, folder_id, params):
+    keys = [f"file-list-gen:{user_id}", _file_list_version_key(user_id, folder_id)]
+    try:
+        generation, version = redis_client.mget(keys)
+        if generation is None or version is None:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(key, secrets.token_hex(8), ex=FILE_LIST_VERSION_EX, nx=True)
+            pipe.mget(keys)
+            generation, version = pipe.execute()[-1]
+        generation, version = generation.decode(), version.decode()
+    except Exception as e:
+        print(f"Redis mget error: {e}")
+        return None
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"file-list:{user_id}:{generation}:{folder_id or 'root'}:{version}:{digest}"
+
+# 读取文件列表缓存，返回已编码的 JSON（bytes），未命中或出错返回 None，同时记录命中/未命中次数
+def get_cached_file_list(cache_key):
+    try:
+        cached = redis_client.get(cache_key)
+        redis_client.incr(FILE_LIST_CACHE_HITS_KEY if cached is not None else FILE_LIST_CACHE_MISSES_KEY)
+        return cached
+    except Exception as e:
+        print(f"Redis get error: {e}")
+        return None
+
+# 写入文件列表缓存，data 为已编码的 JSON（bytes）
+def set_cached_file_list(cache_key, data, ex=FILE_LIST_CACHE_EX):
+    try:
+        redis_client.set(cache_key, data, ex=ex)
+    except Exception as e:
+        print(f"Redis set error: {e}")
+
+# 取消文件列表缓存
+#   folder_ids 为内容发生变化的文件夹ID列表（None 表示根目录），只更换这些文件夹的版本号
+#   folder_ids 不传时更换用户版本号，该用户的全部列表缓存失效
+def invalidate_file_list_cache(user_id, folder_ids=None):
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        if folder_ids is None:
+            keys = [f"file-list-gen:{user_id}"]
+        else:
+            keys = list(dict.fromkeys(_file_list_version_key(user_id, folder_id) for folder_id in folder_ids))
+        for key in keys:
+            pipe.set(key, secrets.token_hex(8), ex=FILE_LIST_VERSION_EX)
+        pipe.incrby(FILE_LIST_CACHE_INVALIDATIONS_KEY, len(keys))
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis set error: {e}")
+
+# 文件列表缓存的命中率与失效次数（自计数器创建以来的累计值）
+def get_file_list_cache_stats():
+    hits, misses, invalidations = redis_client.mget(
+        FILE_LIST_CACHE_HITS_KEY, FILE_LIST_CACHE_MISSES_KEY, FILE_LIST_CACHE_INVALIDATIONS_KEY
+    )
+    hits, misses, invalidations = int(hits or 0), int(misses or 0), int(invalidations or 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hitRatio': hits / (hits + misses) if hits + misses else None,
+        'invalidations': invalidations
+    }
+
+# 分页游标编码：将排序键的值编码为不透明字符串，交由前端原样回传
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('utf-8')
+
+# 分页游标解码，格式不正确返回 None
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8'))
+        return values if isinstance(values, list) else None
+    except Exception:
+        return None
+
 def get_file_suffix(file_name):
     """
     获取文件后缀名，并返回后缀名字符串。
@@ -8,43 +8,54 @@ const FileFinderModal = ({ open, onCancel, onExpandFolder, onEdit, onPreview })
   const [searchValue, setSearchValue] = useState('');
   const [loading, setLoading] = useState(false);
   const [results, setResults] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const { messageApi } = useContext(GlobalContext);
 
   useEffect(() => {
     if (open) {
       setSearchValue('');
       setResults([]);
+      setNextCursor(null);
       setLoading(false);
     }
   }, [open]);
 
-  const handleSearch = async () => {
+  // cursor 为空时重新搜索，否则加载下一页并追加到结果末尾
+  const handleSearch = async (cursor) => {
+    const loadMore = typeof cursor === 'string';
     setLoading(true);
     try {
       const res = await axiosInstance.get('/file-management/find-file/', {
         params: {
           fileName: searchValue || undefined,
+          cursor: loadMore ? cursor : undefined,
         },
       });
       if (res.status === 200 && res.data.code === '1') {
         // 兼容API返回格式，提取path.filePath
-        const data = (res.data.data || []).map(item => ({
+        const data = (res.data.data?.items || []).map(item => ({
           ...item,
           // 路径渲染为 / a / b / c /
           full_path: Array.isArray(item.path) && item.path.length
             ? `/ ${item.path.map(p => p.name).join(' / ')} /`
             : '/',
         }));
-        setResults(data);
+        setResults(prev => (loadMore ? [...prev, ...data] : data));
+        setNextCursor(res.data.data?.next_cursor || null);
       } else if (res.status === 200 && res.data.code === '2') {
         // fileName 为空的特殊处理
         setResults([]);
+        setNextCursor(null);
         messageApi.open({ type: 'warning', content: res.data?.message || 'fileName is required and cannot be empty' });
-      } else {
+      } else if (!loadMore) {
         setResults([]);
+        setNextCursor(null);
       }
     } catch {
-      setResults([]);
+      if (!loadMore) {
+        setResults([]);
+        setNextCursor(null);
+      }
     }
     setLoading(false);
   };
@@ -86,10 +97,10 @@ const FileFinderModal = ({ open, onCancel, onExpandFolder, onEdit, onPreview })
           placeholder="请输入文件名，支持模糊搜索"
           value={searchValue}
           onChange={e => setSearchValue(e.target.value)}
-          onPressEnter={handleSearch}
+          onPressEnter={() => handleSearch()}
           style={{ width: 320 }}
         />
-        <Button type="primary" onClick={handleSearch} loading={loading}>搜索</Button>
+        <Button type="primary" onClick={() => handleSearch()} loading={loading}>搜索</Button>
       </Flex>
       <Table
         rowKey="id"
@@ -99,6 +110,11 @@ const FileFinderModal = ({ open, onCancel, onExpandFolder, onEdit, onPreview })
         pagination={false}
         size="small"
       />
+      {nextCursor && (
+        <Flex justify="center" style={{ marginTop: 16 }}>
+          <Button onClick={() => handleSearch(nextCursor)} loading={loading}>加载更多</Button>
+        </Flex>
+      )}
     </Modal>
   );
 };
@@ -4,6 +4,23 @@ import { UploadOutlined } from '@ant-design/icons';
 import axiosInstance from '../utils/axiosInstance';
 import { GlobalContext } from '../App';
 import OSS from 'ali-oss';
+import { Sha256 } from '../utils/sha256';
+
+const HASH_CHUNK_SIZE = 4 * 1024 * 1024; // 计算哈希时每次读取4MB
+
+// 计算文件内容的 SHA-256（十六进制），用于秒传
+// 不超过一块的文件用 crypto.subtle 一次计算；更大的文件按块读取、增量计算，不把整个文件读入内存
+async function computeFileHash(file) {
+  if (file.size <= HASH_CHUNK_SIZE && window.crypto?.subtle) {
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+  }
+  const hash = new Sha256();
+  for (let start = 0; start < file.size; start += HASH_CHUNK_SIZE) {
+    hash.update(new Uint8Array(await file.slice(start, start + HASH_CHUNK_SIZE).arrayBuffer()));
+  }
+  return hash.digestHex();
+}
 
 const FileUploadModal = ({ parentFolder, modalOpen, updateModalOpen, refreshParent }) => {
   const { messageApi } = useContext(GlobalContext);
@@ -13,6 +30,9 @@ const FileUploadModal = ({ parentFolder, modalOpen, updateModalOpen, refreshPare
 
   const uploadProps = {
     customRequest: async ({ file, onProgress, onSuccess, onError }) => {
+      // 上传配额预留ID，上传或记录失败时释放
+      let reservationId;
+      let inserted = false;
       try {
         if (file.size > 1024 * 1024 * 200) { // 限制文件大小为200MB
           messageApi.open({
@@ -21,8 +41,37 @@ const FileUploadModal = ({ parentFolder, modalOpen, updateModalOpen, refreshPare
           });
           return;
         }
+        // 已上传过相同内容的文件时秒传，无需上传到OSS
+        const contentHash = await computeFileHash(file);
+        if (contentHash) {
+          const instantResponse = await axiosInstance.post(`/file-management/instant-upload/`, {
+            fileName: file.name,
+            parentId: parentFolder.id,
+            fileSize: file.size,
+            contentHash
+          });
+          if (instantResponse.status === 200 && instantResponse.data.code === '1' && instantResponse.data.data?.instant) {
+            onSuccess(instantResponse.data, file);
+            messageApi.open({
+              type: 'success',
+              content: `文件秒传成功 ${file.name}->${parentFolder.name}`,
+            });
+            setFileList((prevList) => prevList.filter(item => item.uid !== file.uid));
+            setUploadedFiles((prevList) => [...prevList, `${parentFolder.name} ${file.name}`]);
+            return;
+          }
+          if (instantResponse.status === 200 && instantResponse.data.code !== '1') {
+            messageApi.open({
+              type: 'error',
+              content: `文件上传失败 ${instantResponse.data.message}`,
+            });
+            return;
+          }
+        }
         // 获取STS临时密钥
-        let response = await axiosInstance.get(`/file-management/get-sts/`);
+        let response = await axiosInstance.get(`/file-management/get-sts/`, {
+          params: { fileSize: file.size }
+        });
         console.log(response)
         let accessToken;
         if (response.status === 200) {
@@ -30,8 +79,9 @@ const FileUploadModal = ({ parentFolder, modalOpen, updateModalOpen, refreshPare
           let data = response.data.data;
           if (code === '1') {
             accessToken = data.access_token;
+            reservationId = data.reservation_id || undefined;
           }
-          if (code === '99') {
+          if (code === '9' || code === '99') {
             messageApi.open({
               type: 'error',
               content: response.data.message,
@@ -93,12 +143,15 @@ const FileUploadModal = ({ parentFolder, modalOpen, updateModalOpen, refreshPare
           fileName: file.name,
           parentId: parentFolder.id,
           ossPath: fileOssPath,
-          fileSize: file.size
+          fileSize: file.size,
+          reservationId,
+          contentHash
         });
         if (response.status === 200) {
           let code = response.data.code;
           let message = response.data.message;
           if (code === '1') {
+            inserted = true;
             onSuccess(completeResult, file);
             messageApi.open({
               type: 'success',
@@ -119,6 +172,10 @@ const FileUploadModal = ({ parentFolder, modalOpen, updateModalOpen, refreshPare
       } catch (error) {
         console.error('Error uploading file:', error);
         onError(error);
+      } finally {
+        if (reservationId && !inserted) {
+          axiosInstance.post(`/file-management/release-upload/`, { reservationId }).catch(() => {});
+        }
       }
     },
     onChange: (info) => {
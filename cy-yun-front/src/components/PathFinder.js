@@ -2,32 +2,48 @@ import { useEffect, useState } from 'react';
 import { Tree, Flex, Modal, Button, Input } from 'antd';
 import axiosInstance from '../utils/axiosInstance';
 
-const fetchFolderContents = async (fileFinderParams = {}) => {
+const FILE_LIST_PAGE_SIZE = 100;
+const LOAD_MORE_KEY_PREFIX = 'load-more:';
+
+// 读取一页，还有下一页时在末尾追加一个“加载更多”节点，选中后再按游标读取下一页
+const fetchFolderContents = async (fileFinderParams = {}, cursor = undefined) => {
   try {
     const response = await axiosInstance.get('/file-management/file-list/', {
       params: {
         // parent_id: parentId, // 根目录为null
         // type_id: 2 // 1:文件 2:文件夹
-        ...fileFinderParams
+        ...fileFinderParams,
+        limit: FILE_LIST_PAGE_SIZE,
+        cursor,
       }
     });
     console.log(response)
-    let list;
     if (response.status === 200) {
       let code = response.data.code;
       let data = response.data.data;
       if (code === '1') {
-        list = data.file_and_folder_list;
+        const list = data.file_and_folder_list.map(item => ({
+          key: item.id,
+          title: item.name,
+          size: item.size,
+          updatedAt: item.updated_at,
+          isLeaf: !item.is_folder,
+          raw: item
+        }));
+        if (data.next_cursor) {
+          list.push({
+            key: `${LOAD_MORE_KEY_PREFIX}${fileFinderParams.parent_id ?? 'root'}`,
+            title: '加载更多',
+            isLeaf: true,
+            loadMore: true,
+            cursor: data.next_cursor,
+            params: { ...fileFinderParams },
+          });
+        }
+        return list;
       }
     }
-    return list?.map(item => ({
-      key: item.id,
-      title: item.name,
-      size: item.size,
-      updatedAt: item.updated_at,
-      isLeaf: !item.is_folder,
-      raw: item
-    }));
+    return [];
   } catch (error) {
     console.error('加载文件夹内容失败：', error);
     return [];
@@ -58,6 +74,17 @@ const updateTreeData = (list, key, children) => list.map(node => {
   return node;
 });
 
+// 用下一页的节点替换“加载更多”节点
+const replaceLoadMoreNode = (list, key, nodes) => list.flatMap(node => {
+  if (node.key === key) {
+    return nodes;
+  }
+  if (node.children) {
+    return [{ ...node, children: replaceLoadMoreNode(node.children, key, nodes) }];
+  }
+  return [node];
+});
+
 // fileFinderParams
 //  parentId: folder id
 //  type_id: 2 // 1:文件 2:文件夹
@@ -100,6 +127,11 @@ const PathFinder = ({ modalOpen, updateModalOpen, updatePathInfo, fileFinderPara
     setTreeData(origin => updateTreeData(origin, key, childrenData));
   };
 
+  const onLoadMore = async (node) => {
+    const nodes = await fetchFolderContents(node.params, node.cursor);
+    setTreeData(origin => replaceLoadMoreNode(origin, node.key, nodes));
+  };
+
   return (
     <Modal
       title={<h2>Path Finder</h2>}
@@ -124,6 +156,10 @@ const PathFinder = ({ modalOpen, updateModalOpen, updatePathInfo, fileFinderPara
           onSelect={(selectedKeys, info) => {
               console.log('selectedKeys', selectedKeys);
               console.log('info', info);
+              if (info.node.loadMore) {
+                onLoadMore(info.node);
+                return;
+              }
               if (selectedKeys.length === 0) return;
 
               const selectedKey = selectedKeys[0];
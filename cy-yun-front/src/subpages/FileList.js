@@ -18,30 +18,48 @@ const {
   NewFileModal,
 } = Components;
 
-const fetchFolderContents = async (parentId = null) => {
+const FILE_LIST_PAGE_SIZE = 100;
+const LOAD_MORE_KEY_PREFIX = 'load-more:';
+
+// 读取一页，还有下一页时在末尾追加一个“加载更多”节点，点击后再按游标读取下一页
+const fetchFolderContents = async (parentId = null, cursor = undefined) => {
   try {
     const response = await axiosInstance.get('/file-management/file-list/', {
       params: {
         parent_id: parentId, // 根目录为null
+        limit: FILE_LIST_PAGE_SIZE,
+        cursor,
       }
     });
     console.log(response)
-    let list;
     if (response.status === 200) {
       let code = response.data.code;
       let data = response.data.data;
       if (code === '1') {
-        list = data.file_and_folder_list;
+        const list = data.file_and_folder_list.map(item => ({
+          key: item.id,
+          title: item.name,
+          // 文件夹显示子树中文件的总大小
+          size: item.is_folder ? item.tree_size : item.size,
+          updatedAt: item.updated_at,
+          isLeaf: !item.is_folder,
+          raw: item
+        }));
+        if (data.next_cursor) {
+          list.push({
+            key: `${LOAD_MORE_KEY_PREFIX}${parentId ?? 'root'}`,
+            title: '加载更多',
+            isLeaf: true,
+            selectable: false,
+            loadMore: true,
+            cursor: data.next_cursor,
+            raw: { is_folder: false, parent_id: parentId },
+          });
+        }
+        return list;
       }
     }
-    return list?.map(item => ({
-      key: item.id,
-      title: item.name,
-      size: item.size,
-      updatedAt: item.updated_at,
-      isLeaf: !item.is_folder,
-      raw: item
-    }));
+    return [];
   } catch (error) {
     console.error('加载文件夹内容失败：', error);
     return [];
@@ -58,6 +76,17 @@ const updateTreeData = (list, key, children) => list.map(node => {
   return node;
 });
 
+// 用下一页的节点替换“加载更多”节点
+const replaceLoadMoreNode = (list, key, nodes) => list.flatMap(node => {
+  if (node.key === key) {
+    return nodes;
+  }
+  if (node.children) {
+    return [{ ...node, children: replaceLoadMoreNode(node.children, key, nodes) }];
+  }
+  return [node];
+});
+
 // 只找路径
 const findPathByKey = (nodes, targetKey, path = []) => {
   for (let node of nodes) {
@@ -439,7 +468,7 @@ const FileList = () => {
     if (node.key) {
       try {
         setAppLoading(true);
-        const res = await axiosInstance.post('/file-management/get-online-edit-file/', { fileId: node.key });
+        const res = await axiosInstance.get('/file-management/get-online-edit-file/', { params: { fileId: node.key } });
         if (res.status === 200 && res.data.code === '1') {
           setOnlineEditPreviewContent(res.data.data.fileContent.content || '');
           setOnlineEditPreviewModalOpen(true);
@@ -495,12 +524,19 @@ const FileList = () => {
     setTreeData(origin => updateTreeData(origin, key, childrenData));
   };
 
+  const onLoadMore = async (node) => {
+    const nodes = await fetchFolderContents(node.raw.parent_id, node.cursor);
+    setTreeData(origin => replaceLoadMoreNode(origin, node.key, nodes));
+  };
+
   const renderTreeNodes = (data) => {
     console.log('renderTreeNodes', data);
     return data.map(item => {
       const node = {
         ...item,
-        title: buildTitle(item),
+        title: item.loadMore
+          ? <Button type="link" size="small" onClick={() => onLoadMore(item)}>{item.title}</Button>
+          : buildTitle(item),
       };
       // 只在有children且非空时递归赋值children字段
       if (item.children && item.children.length > 0) {
@@ -613,7 +649,7 @@ const FileList = () => {
             expandedKeys={expandedKeys}
             selectedKeys={selectedKeys}
             onExpand={setExpandedKeys}
-            draggable
+            draggable={node => !node.loadMore}
             onDrop={onDrop}
             style={{ minWidth: 320 }}
           />
@@ -87,7 +87,7 @@ const MainPage = () => {
       setAppLoading(true);
       if (record.online_editable) {
         // 可在线编辑文件，直接获取内容
-        const res = await axiosInstance.post('/file-management/get-online-edit-file/', { fileId: record.id });
+        const res = await axiosInstance.get('/file-management/get-online-edit-file/', { params: { fileId: record.id } });
         if (res.status === 200 && res.data.code === '1') {
           setPreviewContent(res.data.data.fileContent.content || '');
           setPreviewModalOpen(true);
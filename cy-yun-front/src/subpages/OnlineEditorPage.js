@@ -16,10 +16,48 @@ function getUtf8BytesLength(str) {
   return new TextEncoder().encode(str).length;
 }
 
+const isHighSurrogate = (code) => code >= 0xd800 && code <= 0xdbff;
+const isLowSurrogate = (code) => code >= 0xdc00 && code <= 0xdfff;
+
+// 计算增量保存的修改段：去掉相同的前缀与后缀，中间部分作为一个 [start, deleteCount, insertText]
+// 下标为 UTF-16 码元，与服务端一致；前后缀边界不切开代理对
+function computePatch(base, target) {
+  let prefix = 0;
+  const minLength = Math.min(base.length, target.length);
+  while (prefix < minLength && base.charCodeAt(prefix) === target.charCodeAt(prefix)) {
+    prefix++;
+  }
+  if (prefix > 0 && isHighSurrogate(base.charCodeAt(prefix - 1))) {
+    prefix--;
+  }
+  let suffix = 0;
+  while (
+    suffix < minLength - prefix &&
+    base.charCodeAt(base.length - 1 - suffix) === target.charCodeAt(target.length - 1 - suffix)
+  ) {
+    suffix++;
+  }
+  if (suffix > 0 && isLowSurrogate(base.charCodeAt(base.length - suffix))) {
+    suffix--;
+  }
+  if (prefix === base.length && prefix === target.length) {
+    return [];
+  }
+  return [[prefix, base.length - prefix - suffix, target.slice(prefix, target.length - suffix)]];
+}
+
+// 通知服务端立即把该文件写缓冲中未保存到数据库的内容写入数据库（编辑器关闭时调用）
+// 用 sendBeacon 发送，页面关闭后请求仍会发出；登录凭证在 cookie 中，随请求发送
+function flushFile(id) {
+  const body = new Blob([JSON.stringify({ fileId: id })], { type: 'text/plain' });
+  navigator.sendBeacon(`${axiosInstance.defaults.baseURL}/file-management/flush-online-edit-file/`, body);
+}
+
 const OnlineEditorPage = () => {
   const { messageApi, editableFileInfo, setAppLoading } = useContext(GlobalContext);
   const [fileId, setFileId] = useState(''); // 文件ID，用于API传值，有则为既存文件，无则为新建文件
   const [originalContent, setOriginalContent] = useState(''); // 保存原始内容
+  const [baseHash, setBaseHash] = useState(''); // 原始内容的哈希，增量保存时提交
   const [content, setContent] = useState(``); // UI展示文件内容，兼API传值
   const [fileType, setFileType] = useState(''); // UI展示文件内容，兼API传值
   const [filePath, setFilePath] = useState(''); // UI展示路径
@@ -34,6 +72,7 @@ const OnlineEditorPage = () => {
   const clearCurrentFileState = () => {
     setFileId('');
     setOriginalContent('');
+    setBaseHash('');
     setContent('');
     setFileType('');
     setFilePath('');
@@ -46,8 +85,8 @@ const OnlineEditorPage = () => {
     const fetchFileContent = async () => {
       setAppLoading(true);
       try {
-        const response = await axiosInstance.post(`/file-management/get-online-edit-file/`, {
-          fileId
+        const response = await axiosInstance.get(`/file-management/get-online-edit-file/`, {
+          params: { fileId }
         });
         if (response.status === 200) {
           let code = response.data.code;
@@ -55,6 +94,7 @@ const OnlineEditorPage = () => {
           if (code === '1') {
             let fileContent = data.fileContent;
             setOriginalContent(fileContent.content);
+            setBaseHash(data.contentHash);
             setContent(fileContent.content);
             setFileType(fileContent.file_suffix);
             setUpdatedAt(fileContent.updated_at);
@@ -72,6 +112,19 @@ const OnlineEditorPage = () => {
     }
   }, [fileId]);
 
+  // 切换文件、离开编辑页面或关闭页面时刷写当前文件
+  useEffect(() => {
+    if (!fileId) {
+      return undefined;
+    }
+    const handlePageHide = () => flushFile(fileId);
+    window.addEventListener('pagehide', handlePageHide);
+    return () => {
+      window.removeEventListener('pagehide', handlePageHide);
+      flushFile(fileId);
+    };
+  }, [fileId]);
+
   useEffect(() => {
     if (fileName && fileName.includes('.')) {
       const lastDot = fileName.lastIndexOf('.');
@@ -117,7 +170,20 @@ const OnlineEditorPage = () => {
       requestData.fileId = fileId; // 更新文件需要 fileId
     }
     try {
-      const response = await axiosInstance.post(apiEndpoint, requestData);
+      let response;
+      // 既存文件且有原始内容的哈希时只提交修改段，服务端内容已变化时改为提交全文
+      if (fileId && baseHash) {
+        response = await axiosInstance.post(apiEndpoint, {
+          fileId,
+          baseHash,
+          patch: computePatch(originalContent, content),
+        });
+        if (response.status === 200 && response.data.data?.requireFullContent) {
+          response = await axiosInstance.post(apiEndpoint, requestData);
+        }
+      } else {
+        response = await axiosInstance.post(apiEndpoint, requestData);
+      }
       if (response.status === 200) {
         const { code, message, data } = response.data;
         if (code === '1') { // 成功处理
@@ -126,6 +192,7 @@ const OnlineEditorPage = () => {
           }
           setUpdatedAt(data?.file_info?.updated_at);
           setOriginalContent(content); // 更新原始内容
+          setBaseHash(data?.file_info?.content_hash || '');
           messageApi.open({
             type: 'success',
             content: `文件保存成功 ${filePath} / ${fileName}`,
@@ -1,4 +1,4 @@
-import { useState, useEffect, useContext } from 'react';
+import { useState, useEffect, useContext, useRef } from 'react';
 import { Button, Table, Flex, Popconfirm } from 'antd';
 import { formatDate } from '../utils/utils';
 import axiosInstance from '../utils/axiosInstance';
@@ -23,6 +23,8 @@ const RecycleBin = () => {
   });
   const [onlineEditPreviewModalOpen, setOnlineEditPreviewModalOpen] = useState(false);
   const [onlineEditPreviewContent, setOnlineEditPreviewContent] = useState('');
+  // 已知页码对应的游标（page -> cursor），顺序翻页时使用游标，跳页时退回offset
+  const pageCursorsRef = useRef({ pageSize: 10, cursors: {} });
 
   useEffect(() => {
     fetchRecycleBin(pagination.current, pagination.pageSize);
@@ -32,12 +34,17 @@ const RecycleBin = () => {
   const fetchRecycleBin = async (current = 1, pageSize = 10) => {
     setLoading(true);
     try {
-      const offset = (current - 1) * pageSize;
+      if (pageCursorsRef.current.pageSize !== pageSize) {
+        pageCursorsRef.current = { pageSize, cursors: {} };
+      }
+      const cursor = pageCursorsRef.current.cursors[current];
       const limit = pageSize;
+      const params = cursor ? { cursor, limit } : { offset: (current - 1) * pageSize, limit };
       const response = await axiosInstance.get('/file-management/recycle-bin/', {
-        params: { offset, limit }
+        params
       });
       if (response.status === 200 && response.data.code === '1') {
+        pageCursorsRef.current.cursors[current + 1] = response.data.data?.next_cursor || undefined;
         setDataSource(response.data.data?.items || []);
         setPagination(prev => ({
           ...prev,
@@ -68,7 +75,7 @@ const RecycleBin = () => {
     if (record.id) {
       try {
         setAppLoading(true);
-        const res = await axiosInstance.post('/file-management/get-online-edit-file/', { fileId: record.id });
+        const res = await axiosInstance.get('/file-management/get-online-edit-file/', { params: { fileId: record.id } });
         if (res.status === 200 && res.data.code === '1') {
           setOnlineEditPreviewContent(res.data.data.fileContent.content || '');
           setOnlineEditPreviewModalOpen(true);
@@ -0,0 +1,94 @@
+require('dotenv').config();
+const OSS = require('ali-oss');
+const Redis = require('ioredis');
+
+const ossClient = new OSS({
+  region: process.env.REGION,
+  accessKeyId: process.env.OSS_ACCESS_KEY_ID,
+  accessKeySecret: process.env.OSS_ACCESS_KEY_SECRET,
+  bucket: process.env.BUCKET
+});
+
+const redisClient = new Redis({
+  host: process.env.REDIS_HOST,
+  port: process.env.REDIS_PORT,
+  db: process.env.REDIS_DB
+});
+
+const QUEUE_NAME = 'oss_purge';                       // 待删除队列，主后台 LPUSH
+const PROCESSING_QUEUE = 'oss_purge:processing';      // 处理中队列，进程异常退出时消息不丢失
+const FAILED_QUEUE = 'oss_purge:failed';              // 超过重试次数的消息，需人工处理
+const MAX_ATTEMPTS = 5;
+const BATCH_SIZE = 1000;                              // OSS批量删除接口单次最多1000个对象
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// 批量删除，返回未删除成功的对象路径
+async function deleteKeys(keys) {
+  const remaining = new Set(keys);
+  for (let i = 0; i < keys.length; i += BATCH_SIZE) {
+    const batch = keys.slice(i, i + BATCH_SIZE);
+    const result = await ossClient.deleteMulti(batch, { quiet: false });
+    // ali-oss 不同版本中 deleted 为对象名数组或 { Key } 数组
+    for (const item of result.deleted || []) {
+      remaining.delete(typeof item === 'string' ? item : item.Key);
+    }
+  }
+  return [...remaining];
+}
+
+// 启动时将上次未处理完的消息放回待删除队列
+async function recoverProcessing() {
+  let count = 0;
+  while (await redisClient.rpoplpush(PROCESSING_QUEUE, QUEUE_NAME)) {
+    count++;
+  }
+  if (count) {
+    console.log(`已恢复${count}条未处理完的删除任务`);
+  }
+}
+
+// 消费者逻辑
+async function consumer() {
+  await recoverProcessing();
+  console.log('OSS删除消费者已启动，等待任务...');
+  while (true) {
+    const message = await redisClient.brpoplpush(QUEUE_NAME, PROCESSING_QUEUE, 0);
+    if (!message) continue;
+    let task;
+    try {
+      task = JSON.parse(message);
+    } catch (err) {
+      console.error('无法解析的任务，移入失败队列:', message);
+      await redisClient.multi().lpush(FAILED_QUEUE, message).lrem(PROCESSING_QUEUE, 1, message).exec();
+      continue;
+    }
+    const keys = task.keys || [];
+    const attempts = (task.attempts || 0) + 1;
+    let failedKeys = keys;
+    try {
+      failedKeys = await deleteKeys(keys);
+      console.log(`删除${keys.length - failedKeys.length}/${keys.length}个对象`);
+    } catch (err) {
+      console.error('批量删除失败:', err);
+    }
+    const pipeline = redisClient.multi();
+    if (failedKeys.length) {
+      const retryTask = JSON.stringify({ keys: failedKeys, attempts });
+      if (attempts < MAX_ATTEMPTS) {
+        pipeline.lpush(QUEUE_NAME, retryTask);
+      } else {
+        console.error(`重试${attempts}次后仍删除失败，移入失败队列:`, failedKeys);
+        pipeline.lpush(FAILED_QUEUE, retryTask);
+      }
+    }
+    pipeline.lrem(PROCESSING_QUEUE, 1, message);
+    await pipeline.exec();
+    if (failedKeys.length) {
+      // 失败后退避，避免OSS异常期间空转
+      await sleep(Math.min(1000 * 2 ** attempts, 60000));
+    }
+  }
+}
+
+consumer();
@@ -1,6 +1,7 @@
 require('dotenv').config();
 const fs = require('fs');
 const path = require('path');
+const crypto = require('crypto');
 const OSS = require('ali-oss');
 const Redis = require('ioredis');
 const { Client } = require('pg');
@@ -29,6 +30,7 @@ const pgClient = new Client({
 pgClient.connect();
 
 const MAX_UNCOMPRESSED_FILE_SIZE = 500 * 1024 * 1024; // 单个文件500MB上限
+const RECENT_FILES_EX = 86400; // 与主后台 utils.recent_files.RECENT_FILES_EX 一致
 
 // ZIP文件大小Check
 async function checkZipSizeBeforeExtract(zipPath, maxUncompressedSize) {
@@ -149,19 +151,36 @@ async function consumer() {
         await pgClient.query('BEGIN');
         let importSuccess = false;
         try {
-          async function importDirToCloudfiles(localDir, parentId) {
+          // 导入目标文件夹的祖先链（根目录为空数组），子节点的ancestors = 父节点ancestors + 父节点id
+          let rootAncestors = [];
+          if (folderId) {
+            const folderRes = await pgClient.query(
+              'SELECT ancestors::text[] AS ancestors FROM cloudfiles WHERE id = $1 AND user_id = $2 AND is_folder = TRUE AND deleted_at IS NULL',
+              [folderId, userId]
+            );
+            if (!folderRes.rows.length) {
+              throw new Error('导入目标文件夹不存在');
+            }
+            rootAncestors = [...folderRes.rows[0].ancestors, folderId];
+          }
+          // 导入的文件ID，导入完成后一次性计入祖先文件夹的 tree_size / tree_file_count
+          const importedFileIds = [];
+          // 已上传的OSS对象与总大小，导入完成后一次性计入配额；导入失败回滚时放入OSS删除队列
+          const uploadedOssPaths = [];
+          let importedSize = 0;
+          async function importDirToCloudfiles(localDir, parentId, ancestors) {
             const items = fs.readdirSync(localDir, { withFileTypes: true });
             for (const item of items) {
               const itemPath = path.join(localDir, item.name);
               const isFolder = item.isDirectory();
               // 插入cloudfiles
               const insertRes = await pgClient.query(
-                `INSERT INTO cloudfiles (user_id, name, is_folder, parent_id, created_at, updated_at) VALUES ($1, $2, $3, $4, NOW(), NOW()) RETURNING id`,
-                [userId, item.name, isFolder, parentId]
+                `INSERT INTO cloudfiles (user_id, name, is_folder, parent_id, ancestors, created_at, updated_at) VALUES ($1, $2, $3, $4, $5::uuid[], NOW(), NOW()) RETURNING id`,
+                [userId, item.name, isFolder, parentId, ancestors]
               );
               const newId = insertRes.rows[0].id;
               if (isFolder) {
-                await importDirToCloudfiles(itemPath, newId);
+                await importDirToCloudfiles(itemPath, newId, [...ancestors, newId]);
               } else {
                 // 上传到OSS
                 const now = new Date();
@@ -173,15 +192,46 @@ async function consumer() {
                   `UPDATE cloudfiles SET oss_path=$1, size=$2, file_suffix=$3 WHERE id=$4`,
                   [ossUploadPath, stat.size, path.extname(item.name), newId]
                 );
-                // 更新user_storage_quota.upload_used
-                await pgClient.query(
-                  `UPDATE user_storage_quota SET upload_used = (upload_used::bigint + $1)::text, updated_at = NOW() WHERE user_id = $2`,
-                  [stat.size, userId]
-                );
+                importedFileIds.push(newId);
+                uploadedOssPaths.push(ossUploadPath);
+                importedSize += stat.size;
               }
             }
           }
-          await importDirToCloudfiles(extractDir, folderId);
+          try {
+            await importDirToCloudfiles(extractDir, folderId, rootAncestors);
+            // 按 unnest(ancestors) 分组，一条UPDATE更新所有受影响文件夹的统计（含导入目标文件夹的祖先）
+            if (importedFileIds.length) {
+              await pgClient.query(
+                `UPDATE cloudfiles f
+                 SET tree_size = f.tree_size + d.size, tree_file_count = f.tree_file_count + d.file_count
+                 FROM (
+                   SELECT a.folder_id, SUM(COALESCE(c.size, 0)) AS size, COUNT(*) AS file_count
+                   FROM cloudfiles c CROSS JOIN LATERAL unnest(c.ancestors) AS a(folder_id)
+                   WHERE c.user_id = $1 AND c.id = ANY($2::uuid[])
+                   GROUP BY a.folder_id
+                 ) d
+                 WHERE f.id = d.folder_id AND f.user_id = $1`,
+                [userId, importedFileIds]
+              );
+            }
+            // 配额一次性累加，带条件的UPDATE在数据库中原子地检查上限，与主后台 UserStorageQuota 一致
+            if (importedSize > 0) {
+              const quotaUpdateRes = await pgClient.query(
+                `UPDATE user_storage_quota SET upload_used = upload_used + $1, updated_at = NOW()
+                 WHERE user_id = $2 AND upload_used + $1 <= upload_limit RETURNING upload_used`,
+                [importedSize, userId]
+              );
+              if (!quotaUpdateRes.rows.length) {
+                throw new Error('用户存储空间不足');
+              }
+            }
+          } catch (err) {
+            if (uploadedOssPaths.length) {
+              await redisClient.lpush('oss_purge', JSON.stringify({ keys: uploadedOssPaths, attempts: 0 }));
+            }
+            throw err;
+          }
           importSuccess = true;
         } finally {
           if (importSuccess) {
@@ -195,7 +245,18 @@ async function consumer() {
         await pgClient.query('UPDATE tasks_register SET status=$1, message=$2, updated_at=NOW() WHERE task_id=$3', ['successed', '任务成功', taskId]);
 
         // 清除缓存
-        await redisClient.del(`recent_files:${userId}`);
+        // 重置最近文件索引，下次读取时由主后台从数据库重建；同时更换索引版本号，使最近文件的 ETag 失效（与 recent_files_reset 一致）
+        await redisClient.multi()
+          .del(`recent-files:${userId}:z`, `recent-files:${userId}:meta`, `recent-files:${userId}:ready`)
+          .set(`recent-files:${userId}:ver`, crypto.randomBytes(8).toString('hex'), 'EX', RECENT_FILES_EX)
+          .exec();
+        // 配额已变化，删除主后台的配额镜像，下次预留时从数据库重新加载（与 invalidate_quota_mirror 一致）
+        await redisClient.del(`quota:${userId}`);
+        // 导入涉及新建的多级文件夹，更换该用户的文件列表缓存版本号，使全部列表缓存失效（与主后台 invalidate_file_list_cache 一致）
+        await redisClient.multi()
+          .set(`file-list-gen:${userId}`, crypto.randomBytes(8).toString('hex'), 'EX', 7200)
+          .incr('file-list-cache:invalidations')
+          .exec();
       } catch (err) {
         // 任务失败，更新状态
         await pgClient.query('UPDATE tasks_register SET status=$1, message=$2, updated_at=NOW() WHERE task_id=$3', ['failed', err.message, taskId]);
@@ -1,6 +1,7 @@
 require('dotenv').config();
 const fs = require('fs');
 const path = require('path');
+const zlib = require('zlib');
 const archiver = require('archiver');
 const OSS = require('ali-oss');
 const Redis = require('ioredis');
@@ -42,41 +43,62 @@ async function updateTaskStatus(taskId, status, message = null, ossPath = null)
   await pgClient.query(query, values);
 }
 
-// 递归获取文件结构并在 ZIP_DIR 下创建目录和文件
-async function buildFolderStructure(userId, parentId, targetDir) {
-  // 查询当前目录下所有未删除的文件和文件夹
+// 一次查询取出整棵子树（按ancestors走GIN索引），在内存中按parent_id分组后在 ZIP_DIR 下创建目录和文件
+async function buildFolderStructure(userId, folderId, targetDir) {
+  // 查询子树下所有未删除的文件和文件夹，folderId为空时取该用户全部文件
   const res = await pgClient.query(
-    `SELECT id, name, is_folder, oss_path, online_editable FROM cloudfiles WHERE user_id = $1 AND parent_id ${parentId ? '= $2' : 'IS NULL'} AND deleted_at IS NULL`,
-    parentId ? [userId, parentId] : [userId]
+    `SELECT id, parent_id, name, is_folder, oss_path, online_editable FROM cloudfiles WHERE user_id = $1 AND deleted_at IS NULL ${folderId ? 'AND ancestors @> ARRAY[$2::uuid]' : ''}`,
+    folderId ? [userId, folderId] : [userId]
   );
+  const childrenMap = new Map();
   for (const row of res.rows) {
-    const itemPath = path.join(targetDir, row.name);
-    if (row.is_folder) {
-      // 创建文件夹
-      if (!fs.existsSync(itemPath)) {
-        fs.mkdirSync(itemPath, { recursive: true });
-      }
-      // 递归处理子目录
-      await buildFolderStructure(userId, row.id, itemPath);
-    } else {
-      // 文件
-      if (row.online_editable) {
-        // 可在线编辑文件，从 filecontent 取内容
-        const contentRes = await pgClient.query(
-          'SELECT content FROM filecontent WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL',
-          [row.id, userId]
-        );
-        const content = contentRes.rows[0]?.content || '';
-        fs.writeFileSync(itemPath, content, 'utf8');
+    const key = row.parent_id || null;
+    if (!childrenMap.has(key)) childrenMap.set(key, []);
+    childrenMap.get(key).push(row);
+  }
+  // 只从folderId向下遍历，父文件夹已删除的节点不会被访问到
+  async function writeChildren(parentId, dir) {
+    for (const row of childrenMap.get(parentId || null) || []) {
+      const itemPath = path.join(dir, row.name);
+      if (row.is_folder) {
+        // 创建文件夹
+        if (!fs.existsSync(itemPath)) {
+          fs.mkdirSync(itemPath, { recursive: true });
+        }
+        // 处理子目录
+        await writeChildren(row.id, itemPath);
       } else {
-        // 不可在线编辑文件，从 OSS 下载
-        if (row.oss_path) {
-          const result = await ossClient.get(row.oss_path);
-          fs.writeFileSync(itemPath, result.content);
+        // 文件
+        if (row.online_editable) {
+          // 写缓冲（edit-buf:{id}）有未刷写的保存（version 与 flushed_version 不同）时以其为准；
+          // 干净的缓冲区与数据库一致，或是直接写数据库的保存之后留下的旧内容，均读数据库
+          const [buffered, version, flushedVersion] = await redisClient.hmget(`edit-buf:${row.id}`, 'content', 'version', 'flushed_version');
+          if (buffered !== null && version !== flushedVersion) {
+            fs.writeFileSync(itemPath, buffered, 'utf8');
+            continue;
+          }
+          // 可在线编辑文件，从 filecontent 取内容；content_codec 为 zlib 时内容压缩存储在 content_blob 中
+          const contentRes = await pgClient.query(
+            'SELECT content, content_codec, content_blob FROM filecontent WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL',
+            [row.id, userId]
+          );
+          const contentRow = contentRes.rows[0];
+          if (contentRow?.content_codec === 'zlib') {
+            fs.writeFileSync(itemPath, zlib.inflateSync(contentRow.content_blob));
+          } else {
+            fs.writeFileSync(itemPath, contentRow?.content || '', 'utf8');
+          }
+        } else {
+          // 不可在线编辑文件，从 OSS 下载
+          if (row.oss_path) {
+            const result = await ossClient.get(row.oss_path);
+            fs.writeFileSync(itemPath, result.content);
+          }
         }
       }
     }
   }
+  await writeChildren(folderId, targetDir);
 }
 
 async function createZipFile(sourceDir, outputZipPath) {